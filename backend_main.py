@@ -7,21 +7,48 @@ import time
 import sys
 import signal
 import json
+import queue
+import logging
+import logging.handlers
+from collections import deque, namedtuple
 from datetime import datetime
-from threading import Thread
+from threading import Thread, Event
 import requests
+from requests.adapters import HTTPAdapter
 
 # Flask
-from flask import Flask, request, jsonify
+from flask import Flask, request
 from flask_cors import CORS
 
+# JSON rápido (opcional)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Payloads MQTT binarios (opcional)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Servidor WSGI de producción (opcional)
+try:
+    from waitress import serve
+except ImportError:
+    serve = None
+
 # MQTT
 import paho.mqtt.client as mqtt
 import ssl
+import socket
 
 # Módulos del proyecto
 import config
 from src.database import DatabaseManager
+from src.timeutil import now_iso
+
+log = logging.getLogger("smarthome.backend")
 
 # ========== FLASK APP ==========
 app = Flask(__name__)
@@ -30,10 +57,26 @@ CORS(app)
 backend_instance = None
 
 
+# Lectura del ESP32: el payload de /sensor tiene siempre estos tres campos
+SensorReading = namedtuple("SensorReading", "temperature humidity light")
+
+
+def parse_sensor(body):
+    """Convierte el cuerpo JSON de /sensor en un SensorReading"""
+    data = orjson.loads(body) if orjson else json.loads(body)
+    return SensorReading(data["temperature"], data["humidity"], data["light"])
+
+
+def ojson(data, status=200):
+    """Respuesta JSON serializada con orjson (json estándar si no está instalado)"""
+    body = orjson.dumps(data) if orjson else json.dumps(data)
+    return app.response_class(body, status=status, mimetype="application/json")
+
+
 @app.route('/')
 def home():
     """Endpoint raíz"""
-    return jsonify({
+    return ojson({
         "status": "online",
         "message": "Smart Home IoT Backend",
         "mqtt_connected": backend_instance.mqtt_connected if backend_instance else False,
@@ -51,14 +94,10 @@ def home():
 def receive_sensor_data():
     """Recibe datos del ESP32 (Wokwi vía ngrok)"""
     try:
-        data = request.get_json()
-        
-        temperature = data.get('temperature')
-        humidity = data.get('humidity')
-        light = data.get('light')
+        temperature, humidity, light = parse_sensor(request.get_data(cache=False))
         
-        print(f"\n📥 HTTP: Datos de Wokwi recibidos")
-        print(f"   🌡️  {temperature}°C | 💧 {humidity}% | 💡 {light} lux")
+        log.info("\n📥 HTTP: Datos de Wokwi recibidos")
+        log.info("   🌡️  %s°C | 💧 %s%% | 💡 %s lux", temperature, humidity, light)
         
         # Actualizar estado
         backend_instance.update_sensor_data(temperature, humidity, light)
@@ -66,21 +105,21 @@ def receive_sensor_data():
         # Control automático
         commands = backend_instance.apply_auto_control(temperature, humidity, light)
         
-        return jsonify({
+        return ojson({
             "status": "success",
             "message": "Datos procesados",
             "commands": commands
-        }), 200
+        })
         
     except Exception as e:
-        print(f"❌ Error HTTP: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        log.error("❌ Error HTTP: %s", e)
+        return ojson({"status": "error", "message": str(e)}, 500)
 
 
 @app.route('/command', methods=['GET'])
 def get_commands():
     """Consultar estado actual de actuadores"""
-    return jsonify({
+    return ojson({
         "fan": "on" if backend_instance.actuator_states["fan"] else "off",
         "light": "on" if backend_instance.actuator_states["light"] else "off"
     })
@@ -96,27 +135,27 @@ def manual_control():
         
         backend_instance.execute_command(actuator, action, source="HTTP")
         
-        return jsonify({"status": "success", "actuator": actuator, "action": action})
+        return ojson({"status": "success", "actuator": actuator, "action": action})
         
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return ojson({"status": "error", "message": str(e)}, 500)
 
 
 @app.route('/status', methods=['GET'])
 def get_status():
     """Estado completo del sistema"""
-    return jsonify({
+    return ojson({
         "sensor_data": backend_instance.sensor_data,
         "actuator_states": backend_instance.actuator_states,
         "mqtt_connected": backend_instance.mqtt_connected,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now_iso()
     })
 
 
 @app.route('/stats', methods=['GET'])
 def get_stats():
     """Estadísticas de la base de datos"""
-    return jsonify(backend_instance.database.get_statistics())
+    return ojson(backend_instance.database.get_statistics())
 
 
 # ========== BACKEND PRINCIPAL ==========
@@ -124,18 +163,28 @@ def get_stats():
 class SmartHomeBackend:
     """Backend completo con MQTT + HTTP"""
     
+    # Variación mínima para volver a publicar una lectura por MQTT
+    EPSILONS = {"temperature": 0.2, "humidity": 1.0, "light": 20}
+    
     def __init__(self):
-        print("\n" + "="*70)
-        print("🏠 SMART HOME IOT BACKEND - Modo Completo")
-        print("="*70)
+        log.info("\n" + "="*70)
+        log.info("🏠 SMART HOME IOT BACKEND - Modo Completo")
+        log.info("="*70)
         
         # Base de datos SQLite
         self.database = DatabaseManager()
         self.database.initialize()
         
+        # Escrituras SQLite: cola consumida por un único thread escritor
+        self.db_queue = queue.Queue()
+        self.db_thread = Thread(target=self._db_writer, daemon=True)
+        self.db_thread.start()
+        
         # Cliente MQTT
         self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         self.mqtt_connected = False
+        self._mqtt_ready = Event()
+        self._pub = self._noop_pub  # publish_mqtt mientras haya conexión
         self.setup_mqtt()
         
         # Estado del sistema
@@ -151,10 +200,53 @@ class SmartHomeBackend:
             "light": False
         }
         
+        # Topics de comandos remotos -> actuador
+        self._topic_actuator = {
+            "smarthome/commands/fan": "fan",
+            "smarthome/commands/light": "light"
+        }
+        
+        # Formato de payloads MQTT: MessagePack se publica bajo smarthome/v2/
+        self._use_msgpack = (getattr(config, "MQTT_PAYLOAD_FORMAT", "json") == "msgpack"
+                             and msgpack is not None)
+        
+        # Topics de publicación resueltos una sola vez
+        prefix = "smarthome/v2/" if self._use_msgpack else "smarthome/"
+        topics = {name: topic.replace("smarthome/", prefix, 1)
+                  for name, topic in config.MQTT_TOPICS.items()}
+        self.topic_sensors = topics["sensors"]
+        self.topic_fan = topics["fan_status"]
+        self.topic_light = topics["light_status"]
+        self.topic_alerts = topics["alerts"]
+        self._actuator_topics = {"fan": self.topic_fan, "light": self.topic_light}
+        
+        # Payloads MQTT precalculados para los cambios de estado de actuadores
+        self._state_payloads = {
+            (actuator, state, source): self._encode({"state": state, "source": source})
+            for actuator in ("fan", "light")
+            for state in ("on", "off")
+            for source in ("Manual", "HTTP", "MQTT", "auto")
+        }
+        self._state_payloads[("fan", "on", "auto")] = self._encode(
+            {"state": "on", "source": "auto", "reason": "high_temp"})
+        
         # Control de tiempos
         self.last_thingspeak = 0
         
-        print("✅ Backend inicializado\n")
+        # Últimos valores publicados por MQTT
+        self._last_pub = {"temperature": None, "humidity": None, "light": None}
+        
+        # ThingSpeak: buffer de lecturas enviado en bloque por un worker
+        self.ts_buffer = deque(maxlen=960)
+        self.ts_wakeup = Event()
+        self.ts_bulk_url = (f"https://api.thingspeak.com/channels/"
+                            f"{config.THINGSPEAK_CHANNEL_ID}/bulk_update.json")
+        self.ts_session = requests.Session()
+        self.ts_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.ts_thread = Thread(target=self._thingspeak_worker, daemon=True)
+        self.ts_thread.start()
+        
+        log.info("✅ Backend inicializado\n")
     
     def setup_mqtt(self):
      """Configura cliente MQTT (alineado a config)"""
@@ -167,6 +259,11 @@ class SmartHomeBackend:
      self.mqtt_client.on_connect = self.on_mqtt_connect
      self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
      self.mqtt_client.on_message = self.on_mqtt_message
+     self.mqtt_client.on_socket_open = self.on_mqtt_socket_open
+     
+     # Publicaciones sin back-pressure por mensaje en vuelo
+     self.mqtt_client.max_inflight_messages_set(100)
+     self.mqtt_client.max_queued_messages_set(10000)
 
      # Credenciales
      if getattr(config, "MQTT_USERNAME", None) and getattr(config, "MQTT_PASSWORD", None):
@@ -179,83 +276,137 @@ class SmartHomeBackend:
         # opcional:
         # self.mqtt_client.tls_insecure_set(False)
     
+    def on_mqtt_socket_open(self, client, userdata, sock):
+        """Callback: socket abierto, desactiva Nagle para publicar sin demoras"""
+        # Con WebSockets paho envuelve el socket TCP real
+        raw_sock = getattr(sock, "_socket", sock)
+        try:
+            raw_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (OSError, AttributeError) as e:
+            log.warning("⚠️ MQTT: No se pudo activar TCP_NODELAY - %s", e)
+    
     def on_mqtt_connect(self, client, userdata, flags, rc, properties):
         """Callback: conexión MQTT establecida"""
         if rc == 0:
             self.mqtt_connected = True
-            print("✅ MQTT: Conectado a HiveMQ")
+            self._last_pub = dict.fromkeys(self._last_pub)
+            self._pub = self.publish_mqtt
+            self._mqtt_ready.set()
+            log.info("✅ MQTT: Conectado a HiveMQ")
             
-            # Suscribirse a comandos
-            client.subscribe("smarthome/commands/#")
-            print("📬 MQTT: Suscrito a comandos remotos")
+            # Suscribirse a comandos (un topic por actuador)
+            client.subscribe([(topic, 1) for topic in self._topic_actuator])
+            log.info("📬 MQTT: Suscrito a comandos remotos")
         else:
             self.mqtt_connected = False
-            print(f"❌ MQTT: Error de conexión (código {rc})")
+            self._pub = self._noop_pub
+            log.error("❌ MQTT: Error de conexión (código %s)", rc)
     
     def on_mqtt_disconnect(self, client, userdata, flags, rc, properties):
         """Callback: desconexión MQTT"""
         self.mqtt_connected = False
+        self._pub = self._noop_pub
+        self._mqtt_ready.clear()
         if rc != 0:
-            print(f"⚠️ MQTT: Desconexión inesperada")
+            log.warning("⚠️ MQTT: Desconexión inesperada")
     
     def on_mqtt_message(self, client, userdata, msg):
         """Callback: mensaje MQTT recibido"""
         try:
-            topic = msg.topic
-            payload = msg.payload.decode('utf-8')
-            
-            print(f"\n📩 MQTT: Comando remoto recibido")
-            print(f"   Topic: {topic}")
-            print(f"   Payload: {payload}")
+            actuator = self._topic_actuator.get(msg.topic)
+            if actuator is None:
+                return
             
-            # Parsear comando
-            try:
-                command = json.loads(payload)
-            except:
-                command = {"action": payload}
+            raw = msg.payload
+            log.info("\n📩 MQTT: Comando remoto recibido")
+            log.info("   Topic: %s", msg.topic)
+            log.info("   Payload: %r", raw)
             
-            # Extraer actuador del topic
-            if "fan" in topic:
-                actuator = "fan"
-            elif "light" in topic:
-                actuator = "light"
-            else:
-                return
+            # Parsear comando (MessagePack, JSON o texto plano)
+            command = None
+            if msgpack:
+                try:
+                    command = msgpack.unpackb(raw)
+                except Exception:
+                    pass
+            if not isinstance(command, dict):
+                try:
+                    command = orjson.loads(raw) if orjson else json.loads(raw)
+                except ValueError:
+                    command = None
+            if not isinstance(command, dict):
+                command = {"action": raw.decode('utf-8', errors='replace')}
             
             action = command.get("action", command.get("state", ""))
             
             self.execute_command(actuator, action, source="MQTT")
             
         except Exception as e:
-            print(f"❌ MQTT: Error procesando mensaje: {e}")
+            log.error("❌ MQTT: Error procesando mensaje: %s", e)
     
     def connect_mqtt(self):
         """Conecta al broker MQTT"""
         try:
-            print(f"🔄 MQTT: Conectando a {config.MQTT_BROKER}...")
+            log.info("🔄 MQTT: Conectando a %s...", config.MQTT_BROKER)
             port = getattr(config, "MQTT_PORT", 8883)
             self.mqtt_client.connect(config.MQTT_BROKER, port, keepalive=120)
             self.mqtt_client.loop_start()
-            time.sleep(2)  # Esperar conexión
+            
+            # Esperar el CONNACK (on_mqtt_connect) en lugar de una pausa fija
+            if not self._mqtt_ready.wait(timeout=5):
+                log.warning("⚠️ MQTT: Sin confirmación de conexión tras 5 s")
+                return False
             return True
         except Exception as e:
-            print(f"⚠️ MQTT: No se pudo conectar - {e}")
-            print(f"   El sistema funcionará solo con HTTP")
+            log.warning("⚠️ MQTT: No se pudo conectar - %s", e)
+            log.info("   El sistema funcionará solo con HTTP")
             return False
     
-    def publish_mqtt(self, topic, data):
-        """Publica datos vía MQTT"""
+    def _encode(self, data):
+        """Serializa un payload MQTT (MessagePack o JSON según config)"""
+        if self._use_msgpack:
+            return msgpack.packb(data, use_bin_type=True)
+        return json.dumps(data).encode()
+    
+    def _noop_pub(self, *args, **kwargs):
+        """Publicador sin conexión MQTT: descarta el mensaje"""
+        return False
+    
+    def publish_mqtt(self, topic, data, qos=0):
+        """Publica datos vía MQTT (QoS 0 para telemetría, 1 para estados/alertas)"""
         if not self.mqtt_connected:
             return False
         
         try:
-            payload = json.dumps(data)
-            self.mqtt_client.publish(topic, payload, qos=1)
+            # Los payloads precalculados ya vienen serializados
+            payload = data if isinstance(data, bytes) else self._encode(data)
+            self.mqtt_client.publish(topic, payload, qos=qos)
             return True
         except Exception as e:
-            print(f"⚠️ MQTT: Error publicando - {e}")
+            log.warning("⚠️ MQTT: Error publicando - %s", e)
             return False
     
+    def _sensors_changed(self, temperature, humidity, light):
+        """Indica si alguna lectura varió más que su épsilon desde la última publicación"""
+        current = {"temperature": temperature, "humidity": humidity, "light": light}
+        last = self._last_pub
+        
+        for key, value in current.items():
+            old = last[key]
+            if old is None or value is None or abs(value - old) >= self.EPSILONS[key]:
+                self._last_pub = current
+                return True
+        return False
+    
+    def publish_sensors_batch(self, temperature, humidity, light):
+        """Publica temperatura, humedad y luz en un único mensaje MQTT"""
+        return self._pub(self.topic_sensors, {
+            "temperature": {"v": temperature, "u": "°C"},
+            "humidity": {"v": humidity, "u": "%"},
+            "light": {"v": light, "u": "lux"},
+            "ts": self.sensor_data["timestamp"]
+        })
+    
     def update_sensor_data(self, temperature, humidity, light):
         """Actualiza datos de sensores y distribuye"""
         # Actualizar estado
@@ -263,28 +414,20 @@ class SmartHomeBackend:
             "temperature": temperature,
             "humidity": humidity,
             "light_level": light,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         }
         
-        # Guardar en BD
-        self.database.save_sensor_reading(temperature, humidity, light)
-        print(f"   💾 SQLite: Guardado")
+        # Guardar en BD (thread escritor)
+        self.db_queue.put(([(temperature, humidity, light)], (), ()))
+        log.info("   💾 SQLite: Encolado")
         
-        # Publicar a MQTT
-        if self.mqtt_connected:
-            self.publish_mqtt("smarthome/sensors/temperature", 
-                            {"value": temperature, "unit": "°C"})
-            self.publish_mqtt("smarthome/sensors/humidity", 
-                            {"value": humidity, "unit": "%"})
-            self.publish_mqtt("smarthome/sensors/light", 
-                            {"value": light, "unit": "lux"})
-            print(f"   📡 MQTT: Publicado a HiveMQ")
-        
-        # Enviar a ThingSpeak (con rate limit)
-        current_time = time.time()
-        if current_time - self.last_thingspeak >= 20:
-            self.publish_to_thingspeak()
-            self.last_thingspeak = current_time
+        # Publicar a MQTT (un solo mensaje, solo si alguna lectura cambió)
+        if (self._sensors_changed(temperature, humidity, light)
+                and self.publish_sensors_batch(temperature, humidity, light)):
+            log.info("   📡 MQTT: Publicado a HiveMQ")
+        
+        # Enviar a ThingSpeak (el worker aplica el rate limit)
+        self.publish_to_thingspeak()
     
     def execute_command(self, actuator, action, source="Manual"):
         """Ejecuta comando en actuador"""
@@ -292,158 +435,231 @@ class SmartHomeBackend:
         
         if actuator == "fan":
             self.actuator_states["fan"] = (action == "on")
-            self.database.save_actuator_event("fan", action, auto_triggered=False)
-            print(f"   🎮 {source}: Ventilador {action.upper()}")
+            self.db_queue.put(((), [("fan", action, None, False)], ()))
+            log.info("   🎮 %s: Ventilador %s", source, action.upper())
             
             # Publicar estado a MQTT
-            if self.mqtt_connected:
-                self.publish_mqtt("smarthome/actuators/fan", 
-                                {"state": action, "source": source})
+            payload = self._state_payloads.get(("fan", action, source))
+            self._pub(self.topic_fan, 
+                      payload or {"state": action, "source": source}, qos=1)
         
         elif actuator == "light":
             self.actuator_states["light"] = (action == "on")
-            self.database.save_actuator_event("light", action, auto_triggered=False)
-            print(f"   🎮 {source}: Luz {action.upper()}")
+            self.db_queue.put(((), [("light", action, None, False)], ()))
+            log.info("   🎮 %s: Luz %s", source, action.upper())
             
             # Publicar estado a MQTT
-            if self.mqtt_connected:
-                self.publish_mqtt("smarthome/actuators/light", 
-                                {"state": action, "source": source})
+            payload = self._state_payloads.get(("light", action, source))
+            self._pub(self.topic_light, 
+                      payload or {"state": action, "source": source}, qos=1)
+    
+    # Mensajes de log de las transiciones automáticas
+    _AUTO_LOG = {
+        ("fan", True): "   🔥 Auto: Ventilador ON (%s°C)",
+        ("fan", False): "   ✅ Auto: Ventilador OFF (%s°C)",
+        ("light", True): "   🌙 Auto: Luz ON (%s lux)",
+        ("light", False): "   ☀️ Auto: Luz OFF (%s lux)"
+    }
+    
+    def _transition(self, actuator, new_state, value, commands, events):
+        """Aplica un cambio automático de estado: BD + MQTT + comando al ESP32"""
+        state = "on" if new_state else "off"
+        self.actuator_states[actuator] = new_state
+        commands[actuator] = state
+        events.append((actuator, state, None, True))
+        log.info(self._AUTO_LOG[(actuator, new_state)], value)
+        
+        self._pub(self._actuator_topics[actuator], 
+                  self._state_payloads[(actuator, state, "auto")], qos=1)
     
     def apply_auto_control(self, temperature, humidity, light):
-        """Lógica de control automático"""
+        """Lógica de control automático (publica solo en transiciones)"""
+        th = config.THRESHOLDS
+        states = self.actuator_states
+        pub = self._pub
+        alerts_topic = self.topic_alerts
         commands = {}
+        events = []
+        alerts = []
+        
+        # Estado deseado según umbrales
+        new_fan = temperature > th["temperature_high"]
+        new_light = light < th["light_threshold"]
         
         # Control de ventilador por temperatura
-        if temperature > config.THRESHOLDS["temperature_high"]:
-            if not self.actuator_states["fan"]:
-                self.actuator_states["fan"] = True
-                commands["fan"] = "on"
-                self.database.save_actuator_event("fan", "on", auto_triggered=True)
-                print(f"   🔥 Auto: Ventilador ON ({temperature}°C)")
-                
-                # Publicar a MQTT
-                if self.mqtt_connected:
-                    self.publish_mqtt("smarthome/actuators/fan", 
-                                    {"state": "on", "source": "auto", "reason": "high_temp"})
-                
-                # Alerta crítica
-                if temperature > config.THRESHOLDS["temperature_critical"]:
-                    self.database.save_alert(
-                        "temperature_critical",
-                        f"Temperatura crítica: {temperature}°C",
-                        temperature
-                    )
-                    if self.mqtt_connected:
-                        self.publish_mqtt("smarthome/alerts", {
-                            "type": "critical",
-                            "message": f"Temperatura crítica: {temperature}°C"
-                        })
-        else:
-            if self.actuator_states["fan"]:
-                self.actuator_states["fan"] = False
-                commands["fan"] = "off"
-                self.database.save_actuator_event("fan", "off", auto_triggered=True)
-                print(f"   ✅ Auto: Ventilador OFF ({temperature}°C)")
-                
-                if self.mqtt_connected:
-                    self.publish_mqtt("smarthome/actuators/fan", 
-                                    {"state": "off", "source": "auto"})
+        if new_fan != states["fan"]:
+            self._transition("fan", new_fan, temperature, commands, events)
+            
+            # Alerta crítica
+            if new_fan and temperature > th["temperature_critical"]:
+                message = f"Temperatura crítica: {temperature}°C"
+                alerts.append(("temperature_critical", message, temperature))
+                pub(alerts_topic, {"type": "critical", "message": message}, qos=1)
         
         # Control de luz por nivel de iluminación
-        if light < config.THRESHOLDS["light_threshold"]:
-            if not self.actuator_states["light"]:
-                self.actuator_states["light"] = True
-                commands["light"] = "on"
-                print(f"   🌙 Auto: Luz ON ({light} lux)")
-                
-                if self.mqtt_connected:
-                    self.publish_mqtt("smarthome/actuators/light", 
-                                    {"state": "on", "source": "auto"})
-        else:
-            if self.actuator_states["light"]:
-                self.actuator_states["light"] = False
-                commands["light"] = "off"
-                print(f"   ☀️ Auto: Luz OFF ({light} lux)")
-                
-                if self.mqtt_connected:
-                    self.publish_mqtt("smarthome/actuators/light", 
-                                    {"state": "off", "source": "auto"})
+        if new_light != states["light"]:
+            self._transition("light", new_light, light, commands, events)
         
         # Alerta de humedad
-        if humidity > config.THRESHOLDS["humidity_high"]:
-            self.database.save_alert("humidity_high", f"Humedad alta: {humidity}%", humidity)
-            print(f"   ⚠️ Alerta: Humedad alta ({humidity}%)")
-            
-            if self.mqtt_connected:
-                self.publish_mqtt("smarthome/alerts", {
-                    "type": "warning",
-                    "message": f"Humedad alta: {humidity}%"
-                })
+        if humidity > th["humidity_high"]:
+            message = f"Humedad alta: {humidity}%"
+            alerts.append(("humidity_high", message, humidity))
+            log.warning("   ⚠️ Alerta: Humedad alta (%s%%)", humidity)
+            pub(alerts_topic, {"type": "warning", "message": message}, qos=1)
+        
+        # Un único lote por petición para el thread escritor
+        if events or alerts:
+            self.db_queue.put(((), events, alerts))
         
         return commands
     
+    def _db_writer(self):
+        """Thread escritor: agrupa inserciones en transacciones (64 filas o 500 ms)"""
+        # Conexión propia: en WAL las lecturas de Flask no esperan al escritor
+        db = DatabaseManager(self.database.db_path)
+        
+        running = True
+        while running:
+            item = self.db_queue.get()
+            if item is None:
+                break
+            
+            # Cada elemento es (lecturas, eventos, alertas) de una petición
+            sensor_rows, actuator_rows, alert_rows = [], [], []
+            deadline = time.time() + 0.5
+            
+            while True:
+                sensor_rows.extend(item[0])
+                actuator_rows.extend(item[1])
+                alert_rows.extend(item[2])
+                if len(sensor_rows) + len(actuator_rows) + len(alert_rows) >= 64:
+                    break
+                
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.db_queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+            
+            db.save_batch(sensor_rows, actuator_rows, alert_rows)
+        
+        db.close()
+    
     def publish_to_thingspeak(self):
-        """Envía datos a ThingSpeak"""
+        """Agrega la lectura actual al buffer de ThingSpeak (no bloquea)"""
         if config.THINGSPEAK_API_KEY == "YOUR_WRITE_API_KEY":
             return False
         
-        try:
-            payload = {
-                "api_key": config.THINGSPEAK_API_KEY,
-                "field1": self.sensor_data.get("temperature"),
-                "field2": self.sensor_data.get("humidity"),
-                "field3": self.sensor_data.get("light_level"),
-                "field4": 1 if self.actuator_states["fan"] else 0
-            }
+        self.ts_buffer.append({
+            "created_at": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "field1": self.sensor_data.get("temperature"),
+            "field2": self.sensor_data.get("humidity"),
+            "field3": self.sensor_data.get("light_level"),
+            "field4": 1 if self.actuator_states["fan"] else 0
+        })
+        
+        if len(self.ts_buffer) >= 10:
+            self.ts_wakeup.set()
+        return True
+    
+    def _thingspeak_worker(self):
+        """Worker: envía el buffer vía bulk update (cada 10 lecturas o 20 s)"""
+        while True:
+            self.ts_wakeup.wait(timeout=20)
+            self.ts_wakeup.clear()
             
-            response = requests.get(config.THINGSPEAK_URL, params=payload, timeout=10)
+            if not self.ts_buffer:
+                continue
             
-            if response.status_code == 200:
-                print(f"   ☁️  ThingSpeak: Actualizado")
-                return True
-            return False
-        except Exception as e:
-            print(f"   ⚠️ ThingSpeak: Error - {e}")
-            return False
+            elapsed = time.time() - self.last_thingspeak
+            if len(self.ts_buffer) < 10 and elapsed < 20:
+                continue
+            
+            # ThingSpeak exige al menos 15 s entre bulk updates
+            if elapsed < 15:
+                time.sleep(15 - elapsed)
+            
+            updates = [self.ts_buffer.popleft() for _ in range(len(self.ts_buffer))]
+            
+            try:
+                response = self.ts_session.post(self.ts_bulk_url, json={
+                    "write_api_key": config.THINGSPEAK_API_KEY,
+                    "updates": updates
+                }, timeout=15)
+                
+                if response.status_code in (200, 202):
+                    log.info("   ☁️  ThingSpeak: %s lecturas enviadas", len(updates))
+                else:
+                    log.warning("   ⚠️ ThingSpeak: Error %s", response.status_code)
+            except Exception as e:
+                log.warning("   ⚠️ ThingSpeak: Error - %s", e)
+            
+            self.last_thingspeak = time.time()
     
     def run(self):
-        """Loop principal"""
-        print("🚀 Sistema en ejecución\n")
+        """Loop principal: el servidor HTTP atiende en el thread principal"""
+        log.info("🚀 Sistema en ejecución\n")
         
-        # Intentar conectar MQTT
+        # Intentar conectar MQTT (paho usa su propio loop de red)
         self.connect_mqtt()
         
         try:
-            while True:
-                time.sleep(1)
+            run_flask()
         except KeyboardInterrupt:
-            print("\n\n⏹️  Deteniendo sistema...")
+            log.info("\n\n⏹️  Deteniendo sistema...")
         finally:
             self.cleanup()
     
     def cleanup(self):
         """Limpieza al salir"""
-        print("\n🧹 Limpiando recursos...")
+        log.info("\n🧹 Limpiando recursos...")
         
         if self.mqtt_connected:
             self.mqtt_client.loop_stop()
             self.mqtt_client.disconnect()
         
+        self.ts_session.close()
+        
+        # Vaciar la cola de escrituras pendientes
+        self.db_queue.put(None)
+        self.db_thread.join(timeout=5)
         self.database.close()
         
         stats = self.database.get_statistics()
-        print(f"\n📊 Total lecturas: {stats['total_readings']}")
-        print("✅ Sistema detenido correctamente\n")
+        log.info("\n📊 Total lecturas: %s", stats['total_readings'])
+        log.info("✅ Sistema detenido correctamente\n")
 
 
 # ========== MAIN ==========
 
+def setup_logging():
+    """Logging asíncrono: los threads encolan y un listener escribe en consola"""
+    log_queue = queue.Queue(-1)
+    
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG if config.SYSTEM_CONFIG["debug_mode"] else logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
 def run_flask():
-    """Ejecuta Flask en thread separado"""
-    print("🌐 Flask: http://localhost:5000")
-    print("📡 Esperando conexión de Wokwi vía ngrok\n")
-    app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+    """Ejecuta el servidor HTTP (bloquea hasta que se detiene)"""
+    log.info("🌐 Flask: http://localhost:5000")
+    log.info("📡 Esperando conexión de Wokwi vía ngrok\n")
+    if serve:
+        serve(app, host='0.0.0.0', port=5000, threads=8, connection_limit=200)
+    else:
+        app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False, threaded=True)
 
 
 def main():
@@ -451,24 +667,19 @@ def main():
     
     backend_instance = SmartHomeBackend()
     
-    # Iniciar Flask en thread
-    flask_thread = Thread(target=run_flask, daemon=True)
-    flask_thread.start()
+    log.info("="*70)
+    log.info("🎯 INSTRUCCIONES PARA WOKWI:")
+    log.info("1. En otra terminal ejecuta: ngrok http 5000")
+    log.info("2. Copia la URL: https://xxxxx.ngrok-free.app")
+    log.info("3. Pégala en Wokwi código ESP32 (variable API_URL)")
+    log.info("4. Click Play en Wokwi ▶️")
+    log.info("")
+    log.info("📱 PARA CONTROL MQTT:")
+    log.info("1. Descarga app 'MQTT Dash' o 'IoT MQTT Panel'")
+    log.info("2. Conecta a tu cluster HiveMQ")
+    log.info("3. Configura widgets para topics smarthome/*")
+    log.info("="*70 + "\n")
     
-    print("="*70)
-    print("🎯 INSTRUCCIONES PARA WOKWI:")
-    print("1. En otra terminal ejecuta: ngrok http 5000")
-    print("2. Copia la URL: https://xxxxx.ngrok-free.app")
-    print("3. Pégala en Wokwi código ESP32 (variable API_URL)")
-    print("4. Click Play en Wokwi ▶️")
-    print("")
-    print("📱 PARA CONTROL MQTT:")
-    print("1. Descarga app 'MQTT Dash' o 'IoT MQTT Panel'")
-    print("2. Conecta a tu cluster HiveMQ")
-    print("3. Configura widgets para topics smarthome/*")
-    print("="*70 + "\n")
-    
-    time.sleep(3)
     backend_instance.run()
 
 
@@ -478,10 +689,12 @@ if __name__ == "__main__":
     
     signal.signal(signal.SIGINT, signal_handler)
     
+    listener = setup_logging()
+    
     try:
         main()
     except Exception as e:
-        print(f"\n❌ Error fatal: {e}")
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
\ No newline at end of file
+        log.exception("\n❌ Error fatal: %s", e)
+        sys.exit(1)
+    finally:
+        listener.stop()
\ No newline at end of file
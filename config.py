@@ -16,8 +16,12 @@ MQTT_PASSWORD = "HiveCloud507"
 MQTT_USE_TLS = True
 MQTT_USE_WEBSOCKETS = True     # <<< NUEVO
 
+# Formato de payloads: "json" o "msgpack" (msgpack publica bajo smarthome/v2/...)
+MQTT_PAYLOAD_FORMAT = "json"
+
 # Topics MQTT
 MQTT_TOPICS = {
+    "sensors": "smarthome/sensors",
     "temperature": "smarthome/sensors/temperature",
     "humidity": "smarthome/sensors/humidity",
     "light": "smarthome/sensors/light",
@@ -27,6 +27,10 @@ ON sensor_readings(timestamp);
 CREATE INDEX IF NOT EXISTS idx_sensor_temperature 
 ON sensor_readings(temperature);
 
+-- Índice cubriente para consultas por rango de tiempo (sin leer la tabla)
+CREATE INDEX IF NOT EXISTS idx_sr_ts_cov 
+ON sensor_readings(timestamp DESC, temperature, humidity, light_level);
+
 -- ========================================
 -- TABLA: actuator_events
 -- Registra todos los eventos de actuadores
@@ -78,6 +82,10 @@ ON alerts(timestamp);
 CREATE INDEX IF NOT EXISTS idx_alerts_acknowledged 
 ON alerts(acknowledged);
 
+-- Índice parcial: solo alertas pendientes, ordenadas por fecha
+CREATE INDEX IF NOT EXISTS idx_alerts_open 
+ON alerts(timestamp DESC) WHERE acknowledged = 0;
+
 -- ========================================
 -- TABLA: system_logs (opcional)
 -- Para registro de eventos del sistema
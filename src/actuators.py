@@ -4,16 +4,40 @@ Controla LED RGB, Relay (ventilador), Buzzer y Display OLED
 """
 
 import time
+import asyncio
+import logging
+import threading
 from datetime import datetime
 import config
 
+log = logging.getLogger(__name__)
+
 # Intentar importar librerías de hardware real
 try:
     import RPi.GPIO as GPIO
     REAL_GPIO = True
 except ImportError:
     REAL_GPIO = False
-    print("⚠️ GPIO en modo simulación")
+    log.warning("⚠️ GPIO en modo simulación")
+
+from .gpiomem import open_gpiomem
+
+# Escrituras directas a GPSET0/GPCLR0 (None -> se usa GPIO.output)
+GPIO_MEM = open_gpiomem() if REAL_GPIO else None
+
+# Pines ya configurados como salida (setmode se llama una sola vez)
+_configured_pins = set()
+
+
+def setup_output_pins(pins):
+    """Configura como salida en LOW los pines pendientes con una sola llamada"""
+    pending = [pin for pin in pins if pin not in _configured_pins]
+    if not REAL_GPIO or not pending:
+        return
+    if not _configured_pins:
+        GPIO.setmode(GPIO.BCM)
+    GPIO.setup(pending, GPIO.OUT, initial=GPIO.LOW)
+    _configured_pins.update(pending)
 
 try:
     from PIL import Image, ImageDraw, ImageFont
@@ -22,61 +46,63 @@ try:
     REAL_OLED = True
 except ImportError:
     REAL_OLED = False
-    print("⚠️ OLED en modo simulación")
+    log.warning("⚠️ OLED en modo simulación")
 
 
 class LEDController:
     """Controlador de LED RGB"""
     
+    # Nombre por estado RGB codificado como bits (rojo=1, verde=2, azul=4)
+    _COLOR_NAMES = ("Apagado", "Rojo", "Verde", "Amarillo",
+                    "Azul", "Magenta", "Cian", "Blanco")
+    
     def __init__(self):
         self.pins = {
             "red": config.GPIO_PINS["led_red"],
             "green": config.GPIO_PINS["led_green"],
             "blue": config.GPIO_PINS["led_blue"]
         }
-        self.current_state = {"red": False, "green": False, "blue": False}
+        self._state_bits = 0
         
-        if REAL_GPIO:
-            GPIO.setmode(GPIO.BCM)
-            for color, pin in self.pins.items():
-                GPIO.setup(pin, GPIO.OUT)
-                GPIO.output(pin, GPIO.LOW)
+        # Bit de cada pin en los registros GPSET0/GPCLR0
+        self._red_bit = 1 << self.pins["red"]
+        self._green_bit = 1 << self.pins["green"]
+        self._blue_bit = 1 << self.pins["blue"]
+        self._all_mask = self._red_bit | self._green_bit | self._blue_bit
         
-        print(f"💡 LED RGB inicializado (R:{self.pins['red']}, G:{self.pins['green']}, B:{self.pins['blue']})")
+        setup_output_pins(self.pins.values())
+        
+        log.info("💡 LED RGB inicializado (R:%s, G:%s, B:%s)",
+                 self.pins["red"], self.pins["green"], self.pins["blue"])
     
     def set_color(self, red=False, green=False, blue=False):
         """Establece el color del LED"""
-        self.current_state = {"red": red, "green": green, "blue": blue}
+        self._state_bits = (1 if red else 0) | (2 if green else 0) | (4 if blue else 0)
         
-        if REAL_GPIO:
+        if GPIO_MEM is not None:
+            # Dos escrituras de 32 bits en lugar de tres GPIO.output
+            on_mask = ((self._red_bit if red else 0)
+                       | (self._green_bit if green else 0)
+                       | (self._blue_bit if blue else 0))
+            GPIO_MEM.batch_write(self._all_mask, on_mask)
+        elif REAL_GPIO:
             GPIO.output(self.pins["red"], GPIO.HIGH if red else GPIO.LOW)
             GPIO.output(self.pins["green"], GPIO.HIGH if green else GPIO.LOW)
             GPIO.output(self.pins["blue"], GPIO.HIGH if blue else GPIO.LOW)
         
         color_name = self._get_color_name()
-        print(f"💡 LED: {color_name}")
+        log.debug("💡 LED: %s", color_name)
         return color_name
     
+    @property
+    def current_state(self):
+        """Estado de cada canal (se construye solo bajo demanda)"""
+        bits = self._state_bits
+        return {"red": bool(bits & 1), "green": bool(bits & 2), "blue": bool(bits & 4)}
+    
     def _get_color_name(self):
         """Obtiene el nombre del color actual"""
-        r, g, b = self.current_state["red"], self.current_state["green"], self.current_state["blue"]
-        
-        if r and g and b:
-            return "Blanco"
-        elif r and g:
-            return "Amarillo"
-        elif r and b:
-            return "Magenta"
-        elif g and b:
-            return "Cian"
-        elif r:
-            return "Rojo"
-        elif g:
-            return "Verde"
-        elif b:
-            return "Azul"
-        else:
-            return "Apagado"
+        return self._COLOR_NAMES[self._state_bits]
     
     def off(self):
         """Apaga el LED"""
@@ -108,29 +134,31 @@ class RelayController:
     
     def __init__(self):
         self.pin = config.GPIO_PINS["relay_fan"]
+        self._bit = 1 << self.pin
         self.state = False
         
-        if REAL_GPIO:
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setup(self.pin, GPIO.OUT)
-            GPIO.output(self.pin, GPIO.LOW)
+        setup_output_pins((self.pin,))
         
-        print(f"🌀 Relay (Ventilador) inicializado en pin {self.pin}")
+        log.info("🌀 Relay (Ventilador) inicializado en pin %s", self.pin)
     
     def on(self):
         """Enciende el ventilador"""
         self.state = True
-        if REAL_GPIO:
+        if GPIO_MEM is not None:
+            GPIO_MEM.batch_write(self._bit, self._bit)
+        elif REAL_GPIO:
             GPIO.output(self.pin, GPIO.HIGH)
-        print("🌀 Ventilador: ENCENDIDO")
+        log.debug("🌀 Ventilador: ENCENDIDO")
         return True
     
     def off(self):
         """Apaga el ventilador"""
         self.state = False
-        if REAL_GPIO:
+        if GPIO_MEM is not None:
+            GPIO_MEM.batch_write(self._bit, 0)
+        elif REAL_GPIO:
             GPIO.output(self.pin, GPIO.LOW)
-        print("🌀 Ventilador: APAGADO")
+        log.debug("🌀 Ventilador: APAGADO")
         return False
     
     def toggle(self):
@@ -150,30 +178,103 @@ class BuzzerController:
     
     def __init__(self):
         self.pin = config.GPIO_PINS["buzzer"]
+        self._bit = 1 << self.pin
         
-        if REAL_GPIO:
-            GPIO.setmode(GPIO.BCM)
-            GPIO.setup(self.pin, GPIO.OUT)
-            GPIO.output(self.pin, GPIO.LOW)
+        setup_output_pins((self.pin,))
         
-        print(f"🔔 Buzzer inicializado en pin {self.pin}")
+        # PWM de baja frecuencia: cada periodo es un beep + silencio, así la
+        # cadencia de la alerta la genera RPi.GPIO fuera del thread de Python
+        self._pwm = GPIO.PWM(self.pin, 1) if REAL_GPIO else None
+        self._pwm_timer = None
+        self._pattern_lock = threading.Lock()
+        self._pattern_gen = 0  # Cambia con cada alerta: un Timer viejo no para la nueva
+        
+        log.info("🔔 Buzzer inicializado en pin %s", self.pin)
+    
+    def _write(self, on):
+        """Fija el nivel del pin del buzzer"""
+        if GPIO_MEM is not None:
+            GPIO_MEM.batch_write(self._bit, self._bit if on else 0)
+        else:
+            GPIO.output(self.pin, GPIO.HIGH if on else GPIO.LOW)
     
     def beep(self, duration=0.1):
         """Emite un beep corto"""
         if REAL_GPIO:
-            GPIO.output(self.pin, GPIO.HIGH)
+            self._write(True)
             time.sleep(duration)
-            GPIO.output(self.pin, GPIO.LOW)
+            self._write(False)
+        else:
+            log.debug("🔔 BEEP (%ss)", duration)
+    
+    async def beep_async(self, duration=0.1):
+        """Beep sin bloquear el event loop"""
+        if REAL_GPIO:
+            self._write(True)
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                self._write(False)
         else:
-            print(f"🔔 BEEP ({duration}s)")
+            log.debug("🔔 BEEP (%ss)", duration)
     
     def alert(self, times=3, duration=0.2, interval=0.2):
-        """Emite una secuencia de beeps de alerta"""
-        print(f"🚨 ALERTA: {times} beeps")
-        for i in range(times):
-            self.beep(duration)
-            if i < times - 1:
-                time.sleep(interval)
+        """Emite una secuencia de beeps de alerta
+        
+        No bloquea: arranca el PWM, programa su parada y retorna la duración
+        de la secuencia. Antes esperaba a que terminara; quien necesite
+        esperar debe hacer time.sleep() con el valor devuelto.
+        """
+        with self._pattern_lock:
+            total, gen = self._start_pattern(times, duration, interval)
+            if self._pwm is not None:
+                self._pwm_timer = threading.Timer(total, self._finish_pattern, (gen,))
+                self._pwm_timer.daemon = True
+                self._pwm_timer.start()
+        return total
+    
+    async def alert_async(self, times=3, duration=0.2, interval=0.2):
+        """Secuencia de beeps de alerta sin bloquear el event loop"""
+        with self._pattern_lock:
+            total, gen = self._start_pattern(times, duration, interval)
+        try:
+            await asyncio.sleep(total)
+        finally:
+            self._finish_pattern(gen)
+    
+    def _start_pattern(self, times, duration, interval):
+        """Arranca el PWM de la alerta (con _pattern_lock); devuelve (duración, generación)"""
+        log.info("🚨 ALERTA: %d beeps", times)
+        period = duration + interval
+        total = times * period - interval
+        
+        # Cancela el Timer y el PWM de una alerta anterior antes de arrancar
+        self._stop_locked()
+        if self._pwm is not None:
+            self._pwm.ChangeFrequency(1.0 / period)
+            self._pwm.start(100.0 * duration / period)
+        return total, self._pattern_gen
+    
+    def _finish_pattern(self, gen):
+        """Fin programado de una alerta: no toca una alerta más reciente"""
+        with self._pattern_lock:
+            if gen == self._pattern_gen:
+                self._stop_locked()
+    
+    def _stop_locked(self):
+        """Cancela el Timer pendiente y para el PWM (con _pattern_lock tomado)"""
+        self._pattern_gen += 1
+        if self._pwm_timer is not None:
+            self._pwm_timer.cancel()
+            self._pwm_timer = None
+        if self._pwm is not None:
+            self._pwm.stop()
+            self._write(False)
+    
+    def stop_alert(self):
+        """Detiene una alerta en curso y deja el pin en LOW"""
+        with self._pattern_lock:
+            self._stop_locked()
     
     def alarm(self):
         """Alarma intensa"""
@@ -183,64 +284,132 @@ class BuzzerController:
 class OLEDDisplay:
     """Controlador de Display OLED SSD1306"""
     
+    # Plantilla única de la pantalla de sensores (una línea por fila)
+    _TEMPLATE = "SMART HOME\nTemp: {t}\nHum:  {h}\nLuz:  {l}\n{ts}"
+    
     def __init__(self):
         self.width = 128
         self.height = 64
         self.display = None
+        self._last_sig = None  # Firma del último contenido mostrado
+        self._clock_sec = -1   # Segundo del reloj cacheado
+        self._clock = ""
         
         if REAL_OLED:
+            # Lienzo, contexto de dibujo y fuente reutilizados en cada frame
+            self._image = Image.new("1", (self.width, self.height))
+            self._draw = ImageDraw.Draw(self._image)
+            self._font = ImageFont.load_default()
+            
+            # Girar 270° deja cada columna como una fila de 8 bytes (una página
+            # por byte, bit alto abajo), que es el formato del framebuffer
+            self._rotate = getattr(Image, "Transpose", Image).ROTATE_270
+            
             try:
                 i2c = board.I2C()
                 self.display = adafruit_ssd1306.SSD1306_I2C(self.width, self.height, i2c)
                 self.display.fill(0)
                 self.display.show()
-                print("📺 Display OLED inicializado")
+                log.info("📺 Display OLED inicializado")
             except Exception as e:
-                print(f"❌ Error inicializando OLED: {e}")
+                log.error("❌ Error inicializando OLED: %s", e)
                 self.display = None
         else:
-            print("📺 OLED en modo simulación")
+            log.info("📺 OLED en modo simulación")
     
     def clear(self):
         """Limpia la pantalla"""
+        self._last_sig = None
         if REAL_OLED and self.display:
             self.display.fill(0)
             self.display.show()
     
-    def show_text(self, lines):
-        """Muestra texto en el display"""
+    def show_text(self, lines, sig=None):
+        """Muestra texto en el display (omite el refresco si no cambió)"""
+        if self._is_dirty(lines, sig):
+            self._render_blocking(lines)
+    
+    async def show_text_async(self, lines, sig=None):
+        """Muestra texto renderizando en un executor (PIL + I2C bloquean)"""
+        if self._is_dirty(lines, sig):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._render_blocking, lines)
+    
+    def _is_dirty(self, lines, sig):
+        """Compara la firma del contenido con la del último frame"""
+        if sig is None:
+            sig = hash(tuple(lines))
+        if sig == self._last_sig:
+            return False
+        self._last_sig = sig
+        return True
+    
+    def _render_blocking(self, lines):
+        """Renderiza las líneas y las envía al display (bloqueante)"""
         if REAL_OLED and self.display:
-            # Crear imagen
-            image = Image.new("1", (self.width, self.height))
-            draw = ImageDraw.Draw(image)
+            # Borrar el lienzo cacheado
+            draw = self._draw
+            draw.rectangle((0, 0, self.width, self.height), fill=0)
             
             # Dibujar líneas de texto
             y = 0
             for line in lines:
-                draw.text((0, y), line, fill=255)
+                draw.text((0, y), line, fill=255, font=self._font)
                 y += 12
             
             # Mostrar en display
-            self.display.image(image)
+            self._blit()
             self.display.show()
-        else:
-            # Simulación
-            print("\n" + "="*40)
-            print("📺 DISPLAY OLED:")
-            for line in lines:
-                print(f"  {line}")
-            print("="*40)
+        elif log.isEnabledFor(logging.INFO):
+            # Simulación (el bloque solo se formatea si se va a emitir)
+            log.info("\n%s\n📺 DISPLAY OLED:\n%s\n%s",
+                     "="*40, "\n".join(f"  {line}" for line in lines), "="*40)
+    
+    def _blit(self):
+        """Copia el lienzo al framebuffer del driver empaquetando por páginas"""
+        buf = getattr(self.display, "buffer", None)
+        pages = self.height // 8
+        
+        # SSD1306_I2C reserva buffer[0] para el byte de control 0x40
+        if buf is None or len(buf) != 1 + self.width * pages:
+            # display.image() recorre píxel a píxel en Python: solo como respaldo
+            self.display.image(self._image)
+            return
+        
+        data = self._image.transpose(self._rotate).tobytes()
+        for p in range(pages):
+            buf[1 + p * self.width:1 + (p + 1) * self.width] = data[pages - 1 - p::pages]
     
-    def show_sensor_data(self, temperature, humidity, light_level):
+    def show_sensor_data(self, temperature, humidity, light_level, now_hms=None):
         """Muestra datos de sensores formateados"""
-        lines = [
-            "SMART HOME",
-            f"Temp: {temperature:.1f}C" if temperature else "Temp: --",
-            f"Hum:  {humidity:.1f}%" if humidity else "Hum: --",
-            f"Luz:  {int(light_level)} lux" if light_level else "Luz: --",
-            f"{datetime.now().strftime('%H:%M:%S')}"
-        ]
-        self.show_text(lines)
+        lines = self._sensor_lines(temperature, humidity, light_level, now_hms)
+        self.show_text(lines, self._sensor_sig(lines))
+    
+    async def show_sensor_data_async(self, temperature, humidity, light_level, now_hms=None):
+        """Versión asíncrona de show_sensor_data"""
+        lines = self._sensor_lines(temperature, humidity, light_level, now_hms)
+        await self.show_text_async(lines, self._sensor_sig(lines))
+    
+    def _sensor_sig(self, lines):
+        """Firma de los valores ya redondeados; la hora cuenta cada 10 s"""
+        return hash((tuple(lines[:4]), int(time.time() // 10)))
+    
+    def _sensor_lines(self, temperature, humidity, light_level, now_hms=None):
+        """Líneas de texto para los datos de sensores"""
+        return self._TEMPLATE.format(
+            t=f"{temperature:.1f}C" if temperature else "--",
+            h=f"{humidity:.1f}%" if humidity else "--",
+            l=f"{int(light_level)} lux" if light_level else "--",
+            ts=now_hms or self._clock_str()
+        ).split("\n")
+    
+    def _clock_str(self):
+        """Hora HH:MM:SS, formateada como mucho una vez por segundo"""
+        sec = int(time.time())
+        if sec != self._clock_sec:
+            self._clock_sec = sec
+            self._clock = datetime.now().strftime("%H:%M:%S")
+        return self._clock
     
     def show_status(self, message):
         """Muestra un mensaje de estado"""
@@ -258,14 +427,35 @@ class ActuatorManager:
     """Gestor centralizado de todos los actuadores"""
     
     def __init__(self):
+        # Todos los pines de salida en una sola llamada a GPIO.setup
+        pins = config.GPIO_PINS
+        setup_output_pins((pins["led_red"], pins["led_green"], pins["led_blue"],
+                           pins["relay_fan"], pins["buzzer"]))
+        
+        # Hora muestreada una vez por ciclo de control (ver _tick)
+        self._tick_sec = -1
+        self._tick_time_iso = ""
+        self._tick_time_hms = ""
+        
         self.led = LEDController()
         self.relay = RelayController()
         self.buzzer = BuzzerController()
         self.oled = OLEDDisplay()
         
-        print("\n" + "="*50)
-        print("🎛️  ACTUATOR MANAGER INICIALIZADO")
-        print("="*50)
+        # (actuador, acción) -> (método, resultado); None = lo devuelve el método
+        self._dispatch = {
+            ("fan", "on"): (self.relay.on, "fan_on"),
+            ("fan", "off"): (self.relay.off, "fan_off"),
+            ("fan", "toggle"): (self._fan_toggle, None),
+            ("light", "on"): (self.led.white, "light_on"),
+            ("light", "off"): (self.led.off, "light_off"),
+            ("buzzer", "beep"): (self.buzzer.beep, "buzzer_beep"),
+            ("buzzer", "alert"): (self.buzzer.alert, "buzzer_alert"),
+        }
+        
+        log.info("\n" + "="*50)
+        log.info("🎛️  ACTUATOR MANAGER INICIALIZADO")
+        log.info("="*50)
         
         # Prueba inicial
         self.oled.show_status("Sistema iniciado")
@@ -273,17 +463,55 @@ class ActuatorManager:
         time.sleep(0.5)
         self.led.off()
     
+    def _tick(self):
+        """Muestrea la hora del ciclo (como mucho una vez por segundo)"""
+        sec = int(time.time())
+        if sec != self._tick_sec:
+            self._tick_sec = sec
+            now = datetime.now()
+            self._tick_time_iso = now.isoformat()
+            self._tick_time_hms = now.strftime("%H:%M:%S")
+    
     def update_display(self, sensor_data):
         """Actualiza el display con datos de sensores"""
+        self._tick()
         self.oled.show_sensor_data(
             sensor_data.get("temperature"),
             sensor_data.get("humidity"),
-            sensor_data.get("light_level")
+            sensor_data.get("light_level"),
+            self._tick_time_hms
+        )
+    
+    async def update_display_async(self, sensor_data):
+        """Actualiza el display sin bloquear el event loop"""
+        self._tick()
+        await self.oled.show_sensor_data_async(
+            sensor_data.get("temperature"),
+            sensor_data.get("humidity"),
+            sensor_data.get("light_level"),
+            self._tick_time_hms
         )
     
     def auto_control(self, sensor_data):
         """Control automático basado en sensores"""
+        self._tick()
+        actions, critical = self._apply_auto_control(sensor_data)
+        if critical:
+            self.buzzer.alert()
+        return actions
+    
+    async def auto_control_async(self, sensor_data):
+        """Control automático; la alerta del buzzer no bloquea el event loop"""
+        self._tick()
+        actions, critical = self._apply_auto_control(sensor_data)
+        if critical:
+            await self.buzzer.alert_async()
+        return actions
+    
+    def _apply_auto_control(self, sensor_data):
+        """Aplica relay/LED y devuelve (acciones, alerta crítica pendiente)"""
         actions = []
+        critical = False
         
         temp = sensor_data.get("temperature")
         light = sensor_data.get("light_level")
@@ -297,7 +525,7 @@ class ActuatorManager:
                     actions.append("fan_on")
                     
                     if temp > config.THRESHOLDS["temperature_critical"]:
-                        self.buzzer.alert()
+                        critical = True
             else:
                 if self.relay.state:
                     self.relay.off()
@@ -314,47 +542,28 @@ class ActuatorManager:
                     self.led.off()
                     actions.append("light_off")
         
-        return actions
+        return actions, critical
     
     def manual_control(self, command):
         """Control manual mediante comandos"""
-        action_result = None
-        
-        if command["actuator"] == "fan":
-            if command["action"] == "on":
-                self.relay.on()
-                action_result = "fan_on"
-            elif command["action"] == "off":
-                self.relay.off()
-                action_result = "fan_off"
-            elif command["action"] == "toggle":
-                self.relay.toggle()
-                action_result = f"fan_{'on' if self.relay.state else 'off'}"
+        entry = self._dispatch.get((command["actuator"], command["action"]))
+        if entry is None:
+            return None
         
-        elif command["actuator"] == "light":
-            if command["action"] == "on":
-                self.led.white()
-                action_result = "light_on"
-            elif command["action"] == "off":
-                self.led.off()
-                action_result = "light_off"
-        
-        elif command["actuator"] == "buzzer":
-            if command["action"] == "beep":
-                self.buzzer.beep()
-                action_result = "buzzer_beep"
-            elif command["action"] == "alert":
-                self.buzzer.alert()
-                action_result = "buzzer_alert"
-        
-        return action_result
+        method, action_result = entry
+        result = method()
+        return action_result or result
+    
+    def _fan_toggle(self):
+        """Alterna el ventilador y devuelve la acción resultante"""
+        return "fan_on" if self.relay.toggle() else "fan_off"
     
-    def get_status(self):
-        """Obtiene estado de todos los actuadores"""
+    def get_status(self, now_iso=None):
+        """Obtiene estado de todos los actuadores (hora del último ciclo)"""
         return {
             "fan": self.relay.get_state(),
             "led": self.led._get_color_name(),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso or self._tick_time_iso or datetime.now().isoformat()
         }
     
     def test_all(self):
@@ -387,13 +596,16 @@ class ActuatorManager:
     
     def cleanup(self):
         """Limpia recursos GPIO"""
+        self.buzzer.stop_alert()
         if REAL_GPIO:
             GPIO.cleanup()
-        print("🧹 GPIO limpiado")
+            _configured_pins.clear()
+        log.info("🧹 GPIO limpiado")
 
 
 # Función de prueba
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG, format="%(message)s")
     manager = ActuatorManager()
     manager.test_all()
     manager.cleanup()
\ No newline at end of file
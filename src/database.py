@@ -5,40 +5,154 @@ Almacena lecturas de sensores y eventos de actuadores
 
 import sqlite3
 import os
-from datetime import datetime, timedelta
+import time
+import logging
+import threading
+from collections import deque
+from functools import lru_cache
 import config
 
+log = logging.getLogger(__name__)
+
+
+# Sentencias fijas: el mismo texto SQL reutiliza la sentencia preparada en caché
+SQL_INSERT_READING = """
+    INSERT INTO sensor_readings (temperature, humidity, light_level)
+    VALUES (?, ?, ?)
+"""
+
+# Variante con marca de tiempo explícita (lecturas que pasan por el buffer)
+SQL_INSERT_READING_AT = """
+    INSERT INTO sensor_readings (timestamp, temperature, humidity, light_level)
+    VALUES (?, ?, ?, ?)
+"""
+
+SQL_INSERT_EVENT = """
+    INSERT INTO actuator_events (actuator_type, action, value, auto_triggered)
+    VALUES (?, ?, ?, ?)
+"""
+
+SQL_INSERT_ALERT = """
+    INSERT INTO alerts (alert_type, message, value)
+    VALUES (?, ?, ?)
+"""
+
+SQL_PURGE_BEFORE = (
+    """
+    DELETE FROM sensor_readings WHERE rowid IN (
+        SELECT rowid FROM sensor_readings WHERE timestamp < ? LIMIT ?
+    )
+    """,
+    """
+    DELETE FROM actuator_events WHERE rowid IN (
+        SELECT rowid FROM actuator_events WHERE timestamp < ? LIMIT ?
+    )
+    """,
+)
+
+
+@lru_cache(maxsize=64)
+def _format_utc(epoch):
+    """Segundo epoch -> texto con el formato de CURRENT_TIMESTAMP (UTC)"""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch))
+
+
+def _utc_cutoff(seconds):
+    """Instante de hace N segundos, comparable con la columna timestamp"""
+    return _format_utc(int(time.time()) - seconds)
+
+
+def _round1(value):
+    """Redondea a un decimal conservando None"""
+    return round(value, 1) if value is not None else None
+
 
 class DatabaseManager:
     """Gestor de base de datos SQLite"""
     
-    def __init__(self, db_path=None):
+    STATS_TTL = 10.0       # Segundos que se reutilizan las estadísticas cacheadas
+    FLUSH_INTERVAL = 1.0   # Segundos entre volcados del buffer de lecturas
+    FLUSH_MAX_ROWS = 1000  # Filas por transacción al volcar el buffer
+    
+    def __init__(self, db_path=None, buffer_readings=False):
         self.db_path = db_path or config.DATABASE_PATH
         self.connection = None
+        self._in_batch = False
+        self._wlock = threading.RLock()  # Serializa escrituras entre threads
+        self._last_insert_id_readings = 0  # Cambia con cada lectura guardada aquí
+        self._stats_cache = None           # (clave, instante, estadísticas)
         self.ensure_directory()
         self.connect()
-        print(f"💾 Base de datos: {self.db_path}")
+        log.info("💾 Base de datos: %s", self.db_path)
+        
+        # Buffer opcional: save_sensor_reading encola y un thread vuelca a disco,
+        # así un checkpoint o una SD lenta no frenan el bucle de sensores
+        self._pending = None
+        self._flusher_thread = None
+        if buffer_readings:
+            self._pending = deque(maxlen=4096)  # Si se llena se pierden las más antiguas
+            self._flush_stop = threading.Event()
+            self._flusher_thread = threading.Thread(target=self._flusher, daemon=True)
+            self._flusher_thread.start()
     
     def ensure_directory(self):
         """Asegura que exista el directorio de la base de datos"""
         db_dir = os.path.dirname(self.db_path)
         if db_dir and not os.path.exists(db_dir):
             os.makedirs(db_dir)
-            print(f"📁 Directorio creado: {db_dir}")
+            log.info("📁 Directorio creado: %s", db_dir)
     
     def connect(self):
         """Establece conexión con la base de datos"""
         try:
-            self.connection = sqlite3.connect(self.db_path)
+            # Autocommit (isolation_level=None): las transacciones son explícitas.
+            # El módulo usa menos de 30 sentencias distintas, así que 64 entradas
+            # de caché bastan para que ninguna preparada se desaloje
+            self.connection = sqlite3.connect(
+                self.db_path,
+                check_same_thread=False,
+                isolation_level=None,
+                cached_statements=64
+            )
             self.connection.row_factory = sqlite3.Row  # Acceso por nombre de columna
-            print("✅ Conexión a BD establecida")
+            
+            # Solo surte efecto al crear la BD: permite incremental_vacuum
+            self.connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._incremental_vacuum = self._ensure_incremental_vacuum()
+            
+            # WAL + synchronous=NORMAL: un commit ya no implica un fsync completo
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("PRAGMA temp_store=MEMORY")
+            self.connection.execute("PRAGMA mmap_size=67108864")
+            log.info("✅ Conexión a BD establecida")
         except sqlite3.Error as e:
-            print(f"❌ Error conectando a BD: {e}")
+            log.error("❌ Error conectando a BD: %s", e)
             raise
     
+    def _ensure_incremental_vacuum(self):
+        """Convierte una BD ya existente a auto_vacuum=INCREMENTAL (un VACUUM, una vez)"""
+        if self.connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return True
+        try:
+            # Fuera de transacción (autocommit): reescribe el fichero con el nuevo modo
+            log.info("🗜️  Convirtiendo BD a auto_vacuum incremental (VACUUM único)...")
+            self.connection.execute("VACUUM")
+        except sqlite3.Error as e:
+            log.warning("⚠️ No se pudo activar auto_vacuum incremental: %s", e)
+            return False
+        return self.connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    
     def initialize(self):
         """Crea las tablas si no existen"""
         cursor = self.connection.cursor()
+        cursor.execute("BEGIN")
+        
+        # ¿Faltan estadísticas o índices? Solo entonces hace falta un ANALYZE
+        needs_analyze = cursor.execute("""
+            SELECT COUNT(*) < 3 FROM sqlite_master
+            WHERE name IN ('sqlite_stat1', 'idx_sr_ts_cov', 'idx_alerts_open')
+        """).fetchone()[0]
         
         # Tabla de lecturas de sensores
         cursor.execute("""
@@ -94,51 +208,199 @@ class DatabaseManager:
             ON alerts(timestamp)
         """)
         
-        self.connection.commit()
-        print("✅ Tablas inicializadas")
+        # Índice cubriente: las consultas por rango de tiempo no leen la tabla
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sr_ts_cov 
+            ON sensor_readings(timestamp DESC, temperature, humidity, light_level)
+        """)
+        
+        # Índice parcial: solo las alertas pendientes
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_alerts_open 
+            ON alerts(timestamp DESC) WHERE acknowledged = 0
+        """)
+        
+        cursor.execute("COMMIT")
+        
+        # Estadísticas para que el planificador elija los índices nuevos.
+        # analysis_limit acota el muestreo por índice: sin recorrer tablas enteras
+        cursor.execute("PRAGMA analysis_limit=1000")
+        if needs_analyze:
+            cursor.execute("ANALYZE")
+        else:
+            cursor.execute("PRAGMA optimize").fetchall()
+        log.info("✅ Tablas inicializadas")
+    
+    def begin_batch(self, max_rows=500, max_seconds=1.0):
+        """Inicia modo lote: los save_* confirman cada N filas o T segundos"""
+        self._wlock.acquire()  # El lote retiene el cerrojo hasta end_batch()
+        self.connection.execute("BEGIN IMMEDIATE")
+        self._in_batch = True
+        self._batch_max_rows = max_rows
+        self._batch_max_seconds = max_seconds
+        self._batch_rows = 0
+        self._batch_started = time.monotonic()
+    
+    def end_batch(self):
+        """Finaliza el modo lote confirmando las filas pendientes"""
+        if self._in_batch:
+            self._in_batch = False
+            try:
+                self.connection.commit()
+            finally:
+                self._wlock.release()
+    
+    def _commit(self):
+        """Confirma la escritura (o la agrupa si hay un lote activo)"""
+        if not self._in_batch:
+            return  # En autocommit cada sentencia ya es su propia transacción
+        
+        self._batch_rows += 1
+        if (self._batch_rows >= self._batch_max_rows
+                or time.monotonic() - self._batch_started >= self._batch_max_seconds):
+            self.connection.commit()
+            self.connection.execute("BEGIN IMMEDIATE")
+            self._batch_rows = 0
+            self._batch_started = time.monotonic()
     
     def save_sensor_reading(self, temperature, humidity, light_level):
         """Guarda una lectura de sensores"""
+        if self._pending is not None:
+            self._pending.append((temperature, humidity, light_level, time.time()))
+            return True
+        
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
-                INSERT INTO sensor_readings (temperature, humidity, light_level)
-                VALUES (?, ?, ?)
-            """, (temperature, humidity, light_level))
-            self.connection.commit()
+            with self._wlock:
+                cursor = self.connection.execute(
+                    SQL_INSERT_READING, (temperature, humidity, light_level)
+                )
+                self._commit()
+                self._last_insert_id_readings = cursor.lastrowid
             return cursor.lastrowid
         except sqlite3.Error as e:
-            print(f"❌ Error guardando lectura: {e}")
+            log.error("❌ Error guardando lectura: %s", e)
             return None
     
+    def _flusher(self):
+        """Vuelca el buffer de lecturas periódicamente"""
+        while not self._flush_stop.wait(self.FLUSH_INTERVAL):
+            self.drain()
+    
+    def drain(self):
+        """Escribe en disco las lecturas pendientes (una transacción por tramo)"""
+        pending = self._pending
+        while pending:
+            count = min(self.FLUSH_MAX_ROWS, len(pending))
+            raw_rows = [pending.popleft() for _ in range(count)]
+            rows = [(_format_utc(int(ts)), temperature, humidity, light_level)
+                    for temperature, humidity, light_level, ts in raw_rows]
+            
+            # El rollback debe ocurrir con el lock tomado: la conexión es compartida
+            with self._wlock:
+                try:
+                    cursor = self.connection.cursor()
+                    if not self._in_batch:
+                        cursor.execute("BEGIN")
+                    cursor.executemany(SQL_INSERT_READING_AT, rows)
+                    if self._in_batch:
+                        self._commit()
+                    else:
+                        cursor.execute("COMMIT")
+                    self._last_insert_id_readings = self.connection.execute(
+                        "SELECT last_insert_rowid()"
+                    ).fetchone()[0]
+                except sqlite3.Error as e:
+                    if self.connection.in_transaction and not self._in_batch:
+                        self.connection.rollback()
+                    # Devolver el tramo al frente del buffer: el próximo volcado lo reintenta
+                    pending.extendleft(reversed(raw_rows))
+                    log.error("❌ Error volcando lecturas (%d pendientes): %s", len(pending), e)
+                    return
+    
     def save_actuator_event(self, actuator_type, action, value=None, auto_triggered=False):
         """Guarda un evento de actuador"""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
-                INSERT INTO actuator_events (actuator_type, action, value, auto_triggered)
-                VALUES (?, ?, ?, ?)
-            """, (actuator_type, action, value, auto_triggered))
-            self.connection.commit()
+            with self._wlock:
+                cursor = self.connection.execute(
+                    SQL_INSERT_EVENT, (actuator_type, action, value, auto_triggered)
+                )
+                self._commit()
             return cursor.lastrowid
         except sqlite3.Error as e:
-            print(f"❌ Error guardando evento: {e}")
+            log.error("❌ Error guardando evento: %s", e)
             return None
     
     def save_alert(self, alert_type, message, value=None):
         """Guarda una alerta"""
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("""
-                INSERT INTO alerts (alert_type, message, value)
-                VALUES (?, ?, ?)
-            """, (alert_type, message, value))
-            self.connection.commit()
+            with self._wlock:
+                cursor = self.connection.execute(
+                    SQL_INSERT_ALERT, (alert_type, message, value)
+                )
+                self._commit()
             return cursor.lastrowid
         except sqlite3.Error as e:
-            print(f"❌ Error guardando alerta: {e}")
+            log.error("❌ Error guardando alerta: %s", e)
             return None
     
+    def save_sensor_readings_many(self, rows):
+        """Guarda varias lecturas (temperatura, humedad, luz) con un executemany"""
+        with self._wlock:
+            try:
+                cursor = self.connection.cursor()
+                if not self._in_batch:
+                    cursor.execute("BEGIN")
+                cursor.executemany(SQL_INSERT_READING, rows)
+                count = cursor.rowcount
+                if self._in_batch:
+                    self._commit()
+                else:
+                    cursor.execute("COMMIT")
+                self._last_insert_id_readings = self.connection.execute(
+                    "SELECT last_insert_rowid()"
+                ).fetchone()[0]
+                return count
+            except sqlite3.Error as e:
+                if self.connection.in_transaction and not self._in_batch:
+                    self.connection.rollback()
+                log.error("❌ Error guardando lecturas: %s", e)
+                return None
+    
+    def save_batch(self, sensor_rows=(), actuator_rows=(), alert_rows=()):
+        """Guarda lecturas, eventos y alertas en una sola transacción"""
+        with self._wlock:
+            return self._save_batch(sensor_rows, actuator_rows, alert_rows)
+    
+    def _save_batch(self, sensor_rows, actuator_rows, alert_rows):
+        try:
+            cursor = self.connection.cursor()
+            if not self._in_batch:
+                cursor.execute("BEGIN IMMEDIATE")
+            
+            if sensor_rows:
+                cursor.executemany(SQL_INSERT_READING, sensor_rows)
+            
+            if actuator_rows:
+                cursor.executemany(SQL_INSERT_EVENT, actuator_rows)
+            
+            if alert_rows:
+                cursor.executemany(SQL_INSERT_ALERT, alert_rows)
+            
+            if self._in_batch:
+                self._commit()
+            else:
+                cursor.execute("COMMIT")
+            if sensor_rows:
+                self._last_insert_id_readings = self.connection.execute(
+                    "SELECT last_insert_rowid()"
+                ).fetchone()[0]
+            return True
+        except sqlite3.Error as e:
+            if self.connection.in_transaction and not self._in_batch:
+                self.connection.rollback()
+            log.error("❌ Error guardando lote: %s", e)
+            return False
+    
     def get_last_readings(self, limit=10):
         """Obtiene las últimas N lecturas"""
         cursor = self.connection.cursor()
@@ -152,30 +414,36 @@ class DatabaseManager:
     def get_last_24h_readings(self):
         """Obtiene lecturas de las últimas 24 horas"""
         cursor = self.connection.cursor()
-        yesterday = datetime.now() - timedelta(hours=24)
         cursor.execute("""
-            SELECT * FROM sensor_readings
+            SELECT timestamp, temperature, humidity, light_level
+            FROM sensor_readings
             WHERE timestamp >= ?
             ORDER BY timestamp DESC
-        """, (yesterday.isoformat(),))
+        """, (_utc_cutoff(24 * 3600),))
         return cursor.fetchall()
     
     def get_hourly_averages(self, hours=24):
         """Calcula promedios por hora"""
         cursor = self.connection.cursor()
-        start_time = datetime.now() - timedelta(hours=hours)
+        # strftime se evalúa una sola vez por fila, en la subconsulta, que
+        # se resuelve sobre el índice cubriente idx_sr_ts_cov
         cursor.execute("""
             SELECT 
-                strftime('%Y-%m-%d %H:00:00', timestamp) as hour,
+                hour,
                 AVG(temperature) as avg_temp,
                 AVG(humidity) as avg_humidity,
                 AVG(light_level) as avg_light,
                 COUNT(*) as count
-            FROM sensor_readings
-            WHERE timestamp >= ?
+            FROM (
+                SELECT 
+                    strftime('%Y-%m-%d %H:00:00', timestamp) as hour,
+                    temperature, humidity, light_level
+                FROM sensor_readings
+                WHERE timestamp >= ?
+            )
             GROUP BY hour
             ORDER BY hour DESC
-        """, (start_time.isoformat(),))
+        """, (_utc_cutoff(hours * 3600),))
         return cursor.fetchall()
     
     def get_actuator_history(self, limit=50):
@@ -191,6 +459,16 @@ class DatabaseManager:
     def get_alerts(self, acknowledged=False, limit=20):
         """Obtiene alertas"""
         cursor = self.connection.cursor()
+        if not acknowledged:
+            # Literal (no parámetro) para que aplique el índice parcial
+            cursor.execute("""
+                SELECT * FROM alerts
+                WHERE acknowledged = 0
+                ORDER BY timestamp DESC
+                LIMIT ?
+            """, (limit,))
+            return cursor.fetchall()
+        
         cursor.execute("""
             SELECT * FROM alerts
             WHERE acknowledged = ?
@@ -201,18 +479,26 @@ class DatabaseManager:
     
     def acknowledge_alert(self, alert_id):
         """Marca una alerta como reconocida"""
-        cursor = self.connection.cursor()
-        cursor.execute("""
-            UPDATE alerts
-            SET acknowledged = 1
-            WHERE id = ?
-        """, (alert_id,))
-        self.connection.commit()
+        with self._wlock:
+            self.connection.execute("""
+                UPDATE alerts
+                SET acknowledged = 1
+                WHERE id = ?
+            """, (alert_id,))
     
     def get_statistics(self):
         """Obtiene estadísticas generales"""
         cursor = self.connection.cursor()
         
+        # data_version cambia cuando otra conexión (p. ej. el thread escritor)
+        # confirma datos; las escrituras propias se ven en el último id
+        data_version = cursor.execute("PRAGMA data_version").fetchone()[0]
+        key = (data_version, self._last_insert_id_readings)
+        cached = self._stats_cache
+        if (cached and cached[0] == key
+                and time.monotonic() - cached[1] < self.STATS_TTL):
+            return cached[2]
+        
         # Últimas 24 horas
         cursor.execute("""
             SELECT 
@@ -228,77 +514,79 @@ class DatabaseManager:
             WHERE timestamp >= datetime('now', '-24 hours')
         """)
         
-        stats = cursor.fetchone()
+        (total, avg_t, min_t, max_t,
+         avg_h, min_h, max_h, avg_l) = map(_round1, cursor.fetchone())
         
-        return {
-            "total_readings": stats["total_readings"],
-            "temperature": {
-                "avg": round(stats["avg_temp"], 1) if stats["avg_temp"] else None,
-                "min": round(stats["min_temp"], 1) if stats["min_temp"] else None,
-                "max": round(stats["max_temp"], 1) if stats["max_temp"] else None
-            },
-            "humidity": {
-                "avg": round(stats["avg_humidity"], 1) if stats["avg_humidity"] else None,
-                "min": round(stats["min_humidity"], 1) if stats["min_humidity"] else None,
-                "max": round(stats["max_humidity"], 1) if stats["max_humidity"] else None
-            },
-            "light": {
-                "avg": round(stats["avg_light"], 1) if stats["avg_light"] else None
-            }
+        stats = {
+            "total_readings": int(total),
+            "temperature": {"avg": avg_t, "min": min_t, "max": max_t},
+            "humidity": {"avg": avg_h, "min": min_h, "max": max_h},
+            "light": {"avg": avg_l}
         }
+        self._stats_cache = (key, time.monotonic(), stats)
+        return stats
     
-    def cleanup_old_data(self, days=30):
+    def cleanup_old_data(self, days=30, batch_size=5000):
         """Elimina datos antiguos (mantiene solo últimos N días)"""
-        cursor = self.connection.cursor()
-        cutoff_date = datetime.now() - timedelta(days=days)
+        cutoff = _utc_cutoff(days * 86400)
+        deleted_readings = 0
         
-        cursor.execute("""
-            DELETE FROM sensor_readings
-            WHERE timestamp < ?
-        """, (cutoff_date.isoformat(),))
-        
-        cursor.execute("""
-            DELETE FROM actuator_events
-            WHERE timestamp < ?
-        """, (cutoff_date.isoformat(),))
+        # Borrado por tramos: cada DELETE es una transacción corta y el
+        # cerrojo se libera entre tramos para no frenar las escrituras
+        for sql in SQL_PURGE_BEFORE:
+            while True:
+                with self._wlock:
+                    cursor = self.connection.execute(
+                        sql, (cutoff, batch_size)
+                    )
+                deleted_readings += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
         
-        deleted_readings = cursor.rowcount
-        self.connection.commit()
+        # Devolver páginas libres sin un VACUUM completo; fetchall() hace
+        # que el PRAGMA se ejecute hasta el final (sin efecto si auto_vacuum=NONE)
+        if self._incremental_vacuum:
+            with self._wlock:
+                self.connection.execute("PRAGMA incremental_vacuum(1000)").fetchall()
         
-        print(f"🧹 Limpieza: {deleted_readings} registros antiguos eliminados")
+        log.info("🧹 Limpieza: %d registros antiguos eliminados", deleted_readings)
         return deleted_readings
     
     def export_to_csv(self, output_file="export.csv", days=7):
         """Exporta datos a CSV"""
         import csv
         
+        # Tuplas en lugar de sqlite3.Row: sin un objeto por fila
         cursor = self.connection.cursor()
-        start_date = datetime.now() - timedelta(days=days)
+        cursor.row_factory = None
+        cursor.arraysize = 2000
         
         cursor.execute("""
             SELECT timestamp, temperature, humidity, light_level
             FROM sensor_readings
             WHERE timestamp >= ?
             ORDER BY timestamp
-        """, (start_date.isoformat(),))
-        
-        rows = cursor.fetchall()
+        """, (_utc_cutoff(days * 86400),))
         
         with open(output_file, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile)
             writer.writerow(['Timestamp', 'Temperature', 'Humidity', 'Light Level'])
-            for row in rows:
-                writer.writerow([row['timestamp'], row['temperature'], 
-                               row['humidity'], row['light_level']])
+            # Se itera el cursor: las filas nunca se cargan todas en memoria
+            writer.writerows(cursor)
         
-        print(f"📊 Datos exportados a {output_file}")
+        log.info("📊 Datos exportados a %s", output_file)
         return output_file
     
     def close(self):
         """Cierra la conexión"""
+        if self._flusher_thread is not None:
+            self._flush_stop.set()
+            self._flusher_thread.join()
+            self._flusher_thread = None
+            self.drain()
         if self.connection:
             self.connection.close()
-            print("🔌 Conexión a BD cerrada")
+            log.info("🔌 Conexión a BD cerrada")
 
 
 # Función de prueba
@@ -309,14 +597,16 @@ def test_database():
     db = DatabaseManager("test_smart_home.db")
     db.initialize()
     
-    # Insertar datos de prueba
+    # Insertar datos de prueba (una sola transacción)
     print("Insertando lecturas de prueba...")
+    db.begin_batch()
     for i in range(5):
         db.save_sensor_reading(
             temperature=20 + i,
             humidity=50 + i,
             light_level=300 + i*10
         )
+    db.end_batch()
     
     # Insertar eventos de actuadores
     db.save_actuator_event("fan", "on", auto_triggered=True)
@@ -344,4 +634,5 @@ def test_database():
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG, format="%(message)s")
     test_database()
\ No newline at end of file
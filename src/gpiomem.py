@@ -0,0 +1,67 @@
+"""
+Acceso directo a los registros GPIO mediante /dev/gpiomem
+Escribe GPSET0/GPCLR0 igual que RPi.GPIO internamente, sin una llamada por pin
+"""
+
+import mmap
+import os
+import struct
+
+# Bloque GPIO del BCM2835/6/7/2711 visto a través de /dev/gpiomem
+GPIO_BLOCK_SIZE = 0xB4
+GPSET0 = 0x1C  # Escribir 1 en el bit N pone el pin N en HIGH
+GPCLR0 = 0x28  # Escribir 1 en el bit N pone el pin N en LOW
+
+_WORD = struct.Struct("<I")
+_BCM_SOCS = (b"brcm,bcm2835", b"brcm,bcm2836", b"brcm,bcm2837", b"brcm,bcm2711")
+
+
+class GPIOMem:
+    """Registros GPIO mapeados en memoria (solo escritura de niveles)"""
+    
+    def __init__(self, path="/dev/gpiomem"):
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self._mem = mmap.mmap(fd, GPIO_BLOCK_SIZE, mmap.MAP_SHARED,
+                                  mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+    
+    def set_bits(self, mask):
+        """Pone en HIGH los pines del bitmask"""
+        if mask:
+            _WORD.pack_into(self._mem, GPSET0, mask)
+    
+    def clear_bits(self, mask):
+        """Pone en LOW los pines del bitmask"""
+        if mask:
+            _WORD.pack_into(self._mem, GPCLR0, mask)
+    
+    def batch_write(self, pin_mask, value_mask):
+        """Escribe a la vez los pines de pin_mask con los niveles de value_mask"""
+        self.set_bits(pin_mask & value_mask)
+        self.clear_bits(pin_mask & ~value_mask)
+    
+    def close(self):
+        """Libera el mapeo"""
+        self._mem.close()
+
+
+def _is_bcm_gpio():
+    """El mapa de registros GPSET/GPCLR no existe en la Pi 5 (RP1)"""
+    try:
+        with open("/proc/device-tree/compatible", "rb") as f:
+            compatible = f.read()
+    except OSError:
+        return False
+    return any(soc in compatible for soc in _BCM_SOCS)
+
+
+def open_gpiomem():
+    """Devuelve un GPIOMem, o None si /dev/gpiomem no es utilizable"""
+    if not _is_bcm_gpio():
+        return None
+    try:
+        return GPIOMem()
+    except (OSError, ValueError):
+        return None
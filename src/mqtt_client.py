@@ -7,21 +7,41 @@ import time
 import sys
 import signal
 import json
-from datetime import datetime
-from threading import Thread
+import queue
+import logging
+import logging.handlers
+from collections import deque, namedtuple
+from threading import Thread, Event, Lock
 import requests
+from requests.adapters import HTTPAdapter
 
 # Flask
-from flask import Flask, request, jsonify
+from flask import Flask, request
 from flask_cors import CORS
 
+# Serialización JSON rápida (opcional)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Servidor WSGI de producción (opcional)
+try:
+    from waitress.server import create_server
+except ImportError:
+    create_server = None
+from werkzeug.serving import make_server
+
 # Módulos originales
 import config
 from src.sensors import SensorManager
 from src.actuators import ActuatorManager
 from src.database import DatabaseManager
+from src.timeutil import now_iso
 #from src.mqtt_client import MQTTClient
 
+log = logging.getLogger("smarthome.mqtt_client")
+
 # ========== FLASK APP ==========
 app = Flask(__name__)
 CORS(app)
@@ -30,10 +50,29 @@ CORS(app)
 backend_instance = None
 
 
+# Lectura del ESP32: el payload de /sensor tiene siempre estos tres campos
+SensorReading = namedtuple("SensorReading", "temperature humidity light")
+
+
+def parse_sensor(body):
+    """Convierte el cuerpo JSON de /sensor en un SensorReading de floats"""
+    data = orjson.loads(body) if orjson else json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("Se esperaba un objeto JSON")
+    return SensorReading(float(data["temperature"]), float(data["humidity"]),
+                         float(data["light"]))
+
+
+def ojson(data, status=200):
+    """Respuesta JSON serializada con orjson (json estándar si no está instalado)"""
+    body = orjson.dumps(data) if orjson else json.dumps(data)
+    return app.response_class(body, status=status, mimetype="application/json")
+
+
 @app.route('/')
 def home():
     """Endpoint raíz - Info del API"""
-    return jsonify({
+    return ojson({
         "status": "online",
         "message": "Smart Home IoT Backend - MQTT + HTTP",
         "endpoints": {
@@ -50,31 +89,31 @@ def home():
 def receive_sensor_data():
     """Recibe datos de sensores del ESP32 (Wokwi vía ngrok)"""
     try:
-        data = request.get_json()
-        
-        temperature = data.get('temperature')
-        humidity = data.get('humidity')
-        light = data.get('light')
+        try:
+            temperature, humidity, light = parse_sensor(request.get_data(cache=False))
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning("⚠️ Payload inválido en /sensor: %r", e)
+            return ojson({"status": "error", "message": f"Payload inválido: {e!r}"}, 400)
         
-        print(f"\n📥 Datos recibidos vía HTTP (Wokwi):")
-        print(f"   🌡️  Temperatura: {temperature}°C")
-        print(f"   💧 Humedad: {humidity}%")
-        print(f"   💡 Luz: {light} lux")
+        log.info("\n📥 Datos recibidos vía HTTP (Wokwi):")
+        log.info("   🌡️  %s°C | 💧 %s%% | 💡 %s lux", temperature, humidity, light)
         
-        # Guardar en base de datos
+        # Encolar en BD (el flusher de DatabaseManager agrupa las filas en una transacción)
         backend_instance.database.save_sensor_reading(temperature, humidity, light)
-        print("   💾 Guardado en BD")
+        log.info("   💾 Encolado para BD")
         
         # Actualizar estado
         backend_instance.sensor_data = {
             "temperature": temperature,
             "humidity": humidity,
             "light_level": light,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         }
+        if not backend_instance._sensor_ready:
+            backend_instance._sensor_ready = None not in (temperature, humidity, light)
         
-        # Enviar a ThingSpeak
-        backend_instance.publish_to_thingspeak({
+        # Encolar para ThingSpeak (lo envía el worker, sin bloquear la respuesta)
+        backend_instance.thingspeak_queue.append({
             "temperature": temperature,
             "humidity": humidity,
             "light_level": light
@@ -83,24 +122,21 @@ def receive_sensor_data():
         # Aplicar control automático y obtener comandos
         commands = backend_instance.apply_auto_control(temperature, humidity, light)
         
-        return jsonify({
+        return ojson({
             "status": "success",
             "message": "Datos recibidos y procesados",
             "commands": commands
-        }), 200
+        })
         
     except Exception as e:
-        print(f"❌ Error: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
+        log.error("❌ Error: %s", e)
+        return ojson({"status": "error", "message": str(e)}, 500)
 
 
 @app.route('/command', methods=['GET'])
 def get_commands():
     """ESP32 consulta comandos actuales"""
-    return jsonify({
-        "fan": "on" if backend_instance.actuator_states["fan"] else "off",
-        "light": "on" if backend_instance.actuator_states["light"] else "off"
-    })
+    return app.response_class(backend_instance._state_snapshot[2], mimetype="application/json")
 
 
 @app.route('/control', methods=['POST'])
@@ -112,29 +148,30 @@ def manual_control():
         action = data.get('action')
         
         if actuator == "fan":
-            backend_instance.actuator_states["fan"] = (action == "on")
+            backend_instance.set_actuator("fan", action == "on")
             backend_instance.database.save_actuator_event("fan", action, auto_triggered=False)
-            print(f"🎮 Control manual HTTP: Ventilador {action.upper()}")
+            log.info("🎮 Control manual HTTP: Ventilador %s", action.upper())
             
         elif actuator == "light":
-            backend_instance.actuator_states["light"] = (action == "on")
+            backend_instance.set_actuator("light", action == "on")
             backend_instance.database.save_actuator_event("light", action, auto_triggered=False)
-            print(f"🎮 Control manual HTTP: Luz {action.upper()}")
+            log.info("🎮 Control manual HTTP: Luz %s", action.upper())
         
-        return jsonify({"status": "success", "actuator": actuator, "action": action})
+        return ojson({"status": "success", "actuator": actuator, "action": action})
         
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return ojson({"status": "error", "message": str(e)}, 500)
 
 
 @app.route('/status', methods=['GET'])
 def get_status():
     """Estado actual del sistema"""
-    return jsonify({
+    fan, light, _ = backend_instance._state_snapshot
+    return ojson({
         "sensor_data": backend_instance.sensor_data,
-        "actuator_states": backend_instance.actuator_states,
+        "actuator_states": {"fan": fan, "light": light},
         "mqtt_connected": backend_instance.mqtt_connected,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": now_iso()
     })
 
 
@@ -142,7 +179,32 @@ def get_status():
 def get_stats():
     """Estadísticas de la base de datos"""
     stats = backend_instance.database.get_statistics()
-    return jsonify(stats)
+    return ojson(stats)
+
+
+# ========== CONTROL AUTOMÁTICO ==========
+
+# Bits devueltos por decide()
+FAN_ON = 1
+FAN_OFF = 2
+LIGHT_ON = 4
+LIGHT_OFF = 8
+TEMP_CRITICAL = 16
+HUMIDITY_HIGH = 32
+
+
+def decide(t, h, l, fan_on, light_on, t_hi, t_crit, l_thr, h_hi):
+    """Decisión pura del control automático como bitmask (sin efectos laterales)"""
+    hot = t > t_hi
+    dark = l < l_thr
+    # a > b entre booleanos: a activo y b no -> hay transición
+    turn_fan_on = hot > fan_on
+    return (turn_fan_on
+            | (fan_on > hot) << 1
+            | (dark > light_on) << 2
+            | (light_on > dark) << 3
+            | (turn_fan_on & (t > t_crit)) << 4
+            | (h > h_hi) << 5)
 
 
 # ========== BACKEND PRINCIPAL ==========
@@ -151,12 +213,12 @@ class SmartHomeBackend:
     """Backend que soporta MQTT (original) + HTTP (Wokwi)"""
     
     def __init__(self):
-        print("\n" + "="*60)
-        print("🖥️  SMART HOME BACKEND - MQTT + HTTP MODE")
-        print("="*60)
+        log.info("\n" + "="*60)
+        log.info("🖥️  SMART HOME BACKEND - MQTT + HTTP MODE")
+        log.info("="*60)
         
-        # Base de datos
-        self.database = DatabaseManager()
+        # Base de datos (lecturas en buffer: un COMMIT por volcado, no por POST)
+        self.database = DatabaseManager(buffer_readings=True)
         self.database.initialize()
         
         # Cliente MQTT (mantiene funcionalidad original)
@@ -176,184 +238,372 @@ class SmartHomeBackend:
             "light": False
         }
         
-        # Control de tiempos
-        self.last_thingspeak = 0
-        self.last_db_save = 0
+        # Umbrales de control automático (constantes tras el arranque)
+        th = config.THRESHOLDS
+        self._t_high = th["temperature_high"]
+        self._t_crit = th["temperature_critical"]
+        self._light_thr = th["light_threshold"]
+        self._h_high = th["humidity_high"]
+        
+        # ThingSpeak (constantes tras el arranque)
+        self._ts_url = config.THINGSPEAK_URL
+        self._ts_key = config.THINGSPEAK_API_KEY
+        self._ts_enabled = self._ts_key != "YOUR_WRITE_API_KEY"
+        
+        # Waitress atiende peticiones en varios threads a la vez: los escritores
+        # se serializan con state_lock y publican una instantánea inmutable
+        # (fan, light, JSON de /command) que los lectores usan sin lock
+        self.state_lock = Lock()
+        self._publish_state()
+        
+        # Control de tiempos (deadlines en reloj monotónico)
+        self._next_ts_enqueue = 0.0
+        self._next_db_save = 0.0
+        
+        # True cuando sensor_data tiene ya los tres valores
+        self._sensor_ready = False
+        
+        # Despierta el loop principal para terminar
+        self._stop = Event()
+        
+        # Comandos MQTT: el callback encola y un consumidor los aplica en lote
+        self._mqtt_q = queue.Queue()
+        self.mqtt_thread = Thread(target=self._mqtt_consumer, daemon=True)
+        self.mqtt_thread.start()
         
-        print("✅ Backend inicializado\n")
+        # ThingSpeak: las lecturas se encolan y un worker envía la última
+        # cada THINGSPEAK_INTERVAL (límite de la API gratuita: 15 s)
+        self.thingspeak_queue = deque(maxlen=100)
+        self.session = requests.Session()  # Keep-alive: sin handshake TLS por envío
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self._ts_stop = Event()
+        self.ts_thread = Thread(target=self._thingspeak_worker, daemon=True)
+        self.ts_thread.start()
+        
+        log.info("✅ Backend inicializado\n")
+    
+    def _publish_state(self):
+        """Rehace la instantánea de estado (llamar con state_lock tomado)"""
+        states = self.actuator_states
+        fan, light = states["fan"], states["light"]
+        body = {
+            "fan": "on" if fan else "off",
+            "light": "on" if light else "off"
+        }
+        # Asignación atómica: un lector ve la instantánea anterior o la nueva
+        self._state_snapshot = (
+            fan, light, orjson.dumps(body) if orjson else json.dumps(body).encode()
+        )
+    
+    def set_actuator(self, actuator, on):
+        """Cambia un actuador y publica la nueva instantánea"""
+        with self.state_lock:
+            self.actuator_states[actuator] = on
+            self._publish_state()
     
     def handle_mqtt_command(self, command):
-        """Maneja comandos MQTT (funcionalidad original)"""
-        print(f"\n🎮 COMANDO MQTT RECIBIDO:")
-        print(f"   Actuador: {command.get('actuator')}")
-        print(f"   Acción: {command.get('action')}")
+        """Callback MQTT: solo encola; el consumidor aplica los comandos en lote"""
+        self._mqtt_q.put(command)
+    
+    MQTT_BATCH_WINDOW = 0.05  # Segundos que se esperan más comandos para agruparlos
+    MQTT_BATCH_MAX = 64
+    
+    def _mqtt_consumer(self):
+        """Agrupa ráfagas de comandos MQTT: gana la última acción por actuador"""
+        q = self._mqtt_q
+        running = True
+        while running:
+            command = q.get()
+            if command is None:
+                break
+            
+            latest = {}
+            received = 0
+            seen = 0
+            states = self.actuator_states
+            deadline = time.monotonic() + self.MQTT_BATCH_WINDOW
+            
+            while True:
+                seen += 1
+                # Un comando inválido se descarta solo: no debe tumbar el lote
+                actuator = command.get('actuator') if isinstance(command, dict) else None
+                action = command.get('action') if isinstance(command, dict) else None
+                if actuator in states and isinstance(action, str):
+                    latest[actuator] = action
+                    received += 1
+                else:
+                    log.error("   ❌ Comando MQTT inválido: %r", command)
+                if seen >= self.MQTT_BATCH_MAX:
+                    break
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    command = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if command is None:
+                    running = False
+                    break
+            
+            if latest:
+                self._apply_mqtt_commands(latest, received)
+    
+    def _apply_mqtt_commands(self, latest, received):
+        """Aplica los comandos agrupados y guarda un evento por actuador"""
+        log.info("\n🎮 COMANDOS MQTT RECIBIDOS: %s (%s aplicados)", received, len(latest))
         
         try:
-            actuator = command.get('actuator')
-            action = command.get('action')
+            states = self.actuator_states
+            with self.state_lock:
+                for actuator, action in latest.items():
+                    if actuator in states:
+                        states[actuator] = (action == "on")
+                self._publish_state()
             
-            if actuator == "fan":
-                self.actuator_states["fan"] = (action == "on")
-            elif actuator == "light":
-                self.actuator_states["light"] = (action == "on")
+            # Guardar eventos en BD (una transacción por lote)
+            saved = self.database.save_batch(actuator_rows=[
+                (actuator, action, None, False) for actuator, action in latest.items()
+            ])
             
-            # Guardar evento en BD
-            self.database.save_actuator_event(
-                actuator_type=actuator,
-                action=action,
-                auto_triggered=False
-            )
-            
-            print(f"   ✅ Comando ejecutado")
+            for actuator, action in latest.items():
+                log.info("   ✅ %s: %s", actuator, action)
+            if not saved:
+                log.error("   ❌ Eventos MQTT no guardados en BD (%s)", len(latest))
                 
         except Exception as e:
-            print(f"   ❌ Error procesando comando: {e}")
+            log.error("   ❌ Error procesando comandos: %s", e)
     
     def apply_auto_control(self, temperature, humidity, light):
         """Lógica de control automático - retorna comandos"""
+        # Lectura-decisión-escritura atómica entre peticiones concurrentes
+        with self.state_lock:
+            commands = self._apply_auto_control(temperature, humidity, light)
+            if commands:
+                self._publish_state()
+        return commands
+    
+    def _apply_auto_control(self, temperature, humidity, light):
+        states = self.actuator_states
+        mask = decide(temperature, humidity, light, states["fan"], states["light"],
+                      self._t_high, self._t_crit, self._light_thr, self._h_high)
+        if not mask:
+            return {}
+        
         commands = {}
         
         # Control de ventilador por temperatura
-        if temperature > config.THRESHOLDS["temperature_high"]:
-            if not self.actuator_states["fan"]:
-                self.actuator_states["fan"] = True
-                commands["fan"] = "on"
-                self.database.save_actuator_event("fan", "on", auto_triggered=True)
-                print(f"   🔥 Auto: Ventilador ON (Temp: {temperature}°C)")
-                
-                # Alerta crítica
-                if temperature > config.THRESHOLDS["temperature_critical"]:
-                    self.database.save_alert(
-                        "temperature_critical",
-                        f"Temperatura crítica: {temperature}°C",
-                        temperature
-                    )
-        else:
-            if self.actuator_states["fan"]:
-                self.actuator_states["fan"] = False
-                commands["fan"] = "off"
-                self.database.save_actuator_event("fan", "off", auto_triggered=True)
-                print(f"   ✅ Auto: Ventilador OFF (Temp: {temperature}°C)")
+        if mask & FAN_ON:
+            states["fan"] = True
+            commands["fan"] = "on"
+            self.database.save_actuator_event("fan", "on", auto_triggered=True)
+            log.info("   🔥 Auto: Ventilador ON (Temp: %s°C)", temperature)
+            
+            # Alerta crítica
+            if mask & TEMP_CRITICAL:
+                self.database.save_alert(
+                    "temperature_critical",
+                    f"Temperatura crítica: {temperature}°C",
+                    temperature
+                )
+        elif mask & FAN_OFF:
+            states["fan"] = False
+            commands["fan"] = "off"
+            self.database.save_actuator_event("fan", "off", auto_triggered=True)
+            log.info("   ✅ Auto: Ventilador OFF (Temp: %s°C)", temperature)
         
         # Control de luz
-        if light < config.THRESHOLDS["light_threshold"]:
-            if not self.actuator_states["light"]:
-                self.actuator_states["light"] = True
-                commands["light"] = "on"
-                print(f"   🌙 Auto: Luz ON (Luz: {light} lux)")
-        else:
-            if self.actuator_states["light"]:
-                self.actuator_states["light"] = False
-                commands["light"] = "off"
-                print(f"   ☀️ Auto: Luz OFF (Luz: {light} lux)")
+        if mask & LIGHT_ON:
+            states["light"] = True
+            commands["light"] = "on"
+            log.info("   🌙 Auto: Luz ON (Luz: %s lux)", light)
+        elif mask & LIGHT_OFF:
+            states["light"] = False
+            commands["light"] = "off"
+            log.info("   ☀️ Auto: Luz OFF (Luz: %s lux)", light)
         
         # Alertas de humedad
-        if humidity > config.THRESHOLDS["humidity_high"]:
+        if mask & HUMIDITY_HIGH:
             self.database.save_alert(
                 "humidity_high",
                 f"Humedad alta: {humidity}%",
                 humidity
             )
-            print(f"   ⚠️ Alerta: Humedad alta ({humidity}%)")
+            log.warning("   ⚠️ Alerta: Humedad alta (%s%%)", humidity)
         
         return commands
     
+    THINGSPEAK_INTERVAL = 15
+    
+    def _thingspeak_worker(self):
+        """Envía a ThingSpeak la última lectura encolada en cada intervalo"""
+        while not self._ts_stop.wait(self.THINGSPEAK_INTERVAL):
+            pending = self.thingspeak_queue
+            if not pending:
+                continue
+            if not self._ts_enabled:
+                pending.clear()
+                continue
+            
+            # Solo se retiran de la cola tras un envío correcto; si falla,
+            # se reintenta en el próximo intervalo con la lectura más nueva
+            count = len(pending)
+            if self.publish_to_thingspeak(pending[-1]):
+                for _ in range(count):
+                    pending.popleft()
+    
     def publish_to_thingspeak(self, sensor_data):
         """Envía datos a ThingSpeak"""
-        if config.THINGSPEAK_API_KEY == "YOUR_WRITE_API_KEY":
+        if not self._ts_enabled:
             return False
         
         try:
-            url = config.THINGSPEAK_URL
             payload = {
-                "api_key": config.THINGSPEAK_API_KEY,
+                "api_key": self._ts_key,
                 "field1": sensor_data.get("temperature"),
                 "field2": sensor_data.get("humidity"),
                 "field3": sensor_data.get("light_level"),
-                "field4": 1 if self.actuator_states["fan"] else 0
+                "field4": 1 if self._state_snapshot[0] else 0
             }
             
-            response = requests.get(url, params=payload, timeout=10)
+            response = self.session.get(self._ts_url, params=payload, timeout=10)
             
             if response.status_code == 200:
-                print(f"☁️  ThingSpeak actualizado")
+                log.info("☁️  ThingSpeak actualizado")
                 return True
             else:
-                print(f"⚠️ ThingSpeak error: {response.status_code}")
+                log.warning("⚠️ ThingSpeak error: %s", response.status_code)
                 return False
         except Exception as e:
-            print(f"❌ ThingSpeak error: {e}")
+            log.error("❌ ThingSpeak error: %s", e)
             return False
     
     def run_mqtt_mode(self):
         """Modo MQTT original (para dispositivos reales con MQTT)"""
-        print("🚀 Iniciando modo MQTT...")
+        log.info("🚀 Iniciando modo MQTT...")
         
         # Intentar conectar MQTT
         self.mqtt_connected = self.mqtt.connect()
         
         if self.mqtt_connected:
-            print("✅ Modo MQTT activo")
-            time.sleep(2)
-            self.mqtt.client.subscribe("smarthome/sensors/#")
+            log.info("✅ Modo MQTT activo")
+            if not self._subscribe_on_connect():
+                log.warning("⚠️ MQTT: sin CONNACK aún, se suscribirá al conectar")
         else:
-            print("⚠️ MQTT no disponible, solo modo HTTP activo")
+            log.warning("⚠️ MQTT no disponible, solo modo HTTP activo")
         
-        # Loop MQTT (si está conectado)
+        # Loop MQTT: duerme hasta el próximo deadline (o hasta cleanup)
         try:
-            while True:
-                current_time = time.time()
+            while not self._stop.is_set():
+                now = time.monotonic()
                 
                 # Guardar en BD periódicamente
-                if current_time - self.last_db_save >= 30:
-                    if all([
-                        self.sensor_data.get("temperature"),
-                        self.sensor_data.get("humidity"),
-                        self.sensor_data.get("light_level")
-                    ]):
+                if now >= self._next_db_save:
+                    if self._sensor_ready:
+                        data = self.sensor_data
                         self.database.save_sensor_reading(
-                            temperature=self.sensor_data["temperature"],
-                            humidity=self.sensor_data["humidity"],
-                            light_level=self.sensor_data["light_level"]
+                            temperature=data["temperature"],
+                            humidity=data["humidity"],
+                            light_level=data["light_level"]
                         )
-                    self.last_db_save = current_time
+                    self._next_db_save = now + 30
                 
-                # Enviar a ThingSpeak periódicamente
-                if current_time - self.last_thingspeak >= 20:
-                    self.publish_to_thingspeak(self.sensor_data)
-                    self.last_thingspeak = current_time
+                # Enviar a ThingSpeak periódicamente (vía el worker)
+                if now >= self._next_ts_enqueue:
+                    self.thingspeak_queue.append(dict(self.sensor_data))
+                    self._next_ts_enqueue = now + 20
                 
-                time.sleep(1)
+                next_deadline = min(self._next_db_save, self._next_ts_enqueue)
+                self._stop.wait(max(0.0, next_deadline - time.monotonic()))
                 
         except KeyboardInterrupt:
-            print("\n\n⏹️  Deteniendo...")
+            log.info("\n\n⏹️  Deteniendo...")
         finally:
             self.cleanup()
     
+    def _subscribe_on_connect(self, timeout=5):
+        """Suscribe en on_connect (también tras reconexiones); espera solo hasta conectar"""
+        client = self.mqtt.client
+        connected = Event()
+        previous = client.on_connect
+        
+        def on_connect(*args):
+            if previous:
+                previous(*args)
+            client.subscribe("smarthome/sensors/#")
+            connected.set()
+        
+        client.on_connect = on_connect
+        
+        # El CONNACK pudo llegar antes de instalar el callback
+        if client.is_connected():
+            client.subscribe("smarthome/sensors/#")
+            connected.set()
+        
+        return connected.wait(timeout)
+    
     def cleanup(self):
         """Limpia recursos"""
-        print("\n🧹 Limpiando recursos...")
+        log.info("\n🧹 Limpiando recursos...")
+        
+        self._stop.set()
+        self._ts_stop.set()
+        self.session.close()
         
         if self.mqtt_connected:
             self.mqtt.disconnect()
         
+        # Aplicar los comandos pendientes antes de cerrar la BD
+        self._mqtt_q.put(None)
+        self.mqtt_thread.join(timeout=2)
+        
         self.database.close()
         
         # Estadísticas
         stats = self.database.get_statistics()
-        print("\n📊 ESTADÍSTICAS:")
-        print(f"   Total lecturas: {stats['total_readings']}")
+        log.info("\n📊 ESTADÍSTICAS:")
+        log.info("   Total lecturas: %s", stats['total_readings'])
         
-        print("\n✅ Backend detenido\n")
+        log.info("\n✅ Backend detenido\n")
 
 
 # ========== FUNCIONES PRINCIPALES ==========
 
-def run_flask_server():
-    """Ejecuta servidor Flask en thread separado"""
-    print("🌐 Servidor HTTP/Flask iniciado en http://localhost:5000")
-    print("📡 Listo para recibir datos de Wokwi vía ngrok\n")
-    app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+def setup_logging():
+    """Logging asíncrono: los threads encolan y un listener escribe en consola"""
+    log_queue = queue.Queue(-1)
+    
+    root = logging.getLogger()
+    root.setLevel(logging.DEBUG if config.SYSTEM_CONFIG["debug_mode"] else logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    
+    # Sin una línea de log por petición HTTP
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    logging.getLogger("waitress").setLevel(logging.WARNING)
+    
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    return listener
+
+
+def create_http_server():
+    """Abre el socket HTTP ya en el thread principal (un bind fallido se ve al arrancar)"""
+    if create_server:
+        return create_server(app, host='0.0.0.0', port=5000, threads=8, connection_limit=200)
+    return make_server('0.0.0.0', 5000, app, threaded=True)
+
+
+def run_flask_server(server):
+    """Atiende peticiones HTTP en thread separado (socket ya abierto)"""
+    log.info("🌐 Servidor HTTP/Flask iniciado en http://localhost:5000")
+    log.info("📡 Listo para recibir datos de Wokwi vía ngrok\n")
+    if create_server:
+        server.run()
+    else:
+        server.serve_forever()
 
 
 def main():
@@ -364,18 +614,17 @@ def main():
     backend_instance = SmartHomeBackend()
     
     # Iniciar Flask en thread separado
-    flask_thread = Thread(target=run_flask_server, daemon=True)
+    server = create_http_server()
+    flask_thread = Thread(target=run_flask_server, args=(server,), daemon=True)
     flask_thread.start()
     
-    print("\n" + "="*60)
-    print("🎯 INSTRUCCIONES:")
-    print("1. Ejecuta en otra terminal: ngrok http 5000")
-    print("2. Copia la URL de ngrok (ej: https://abc123.ngrok-free.app)")
-    print("3. Pégala en el código ESP32 de Wokwi (variable API_URL)")
-    print("4. Inicia la simulación en Wokwi")
-    print("="*60 + "\n")
-    
-    time.sleep(2)
+    log.info("\n" + "="*60)
+    log.info("🎯 INSTRUCCIONES:")
+    log.info("1. Ejecuta en otra terminal: ngrok http 5000")
+    log.info("2. Copia la URL de ngrok (ej: https://abc123.ngrok-free.app)")
+    log.info("3. Pégala en el código ESP32 de Wokwi (variable API_URL)")
+    log.info("4. Inicia la simulación en Wokwi")
+    log.info("="*60 + "\n")
     
     # Ejecutar modo MQTT (funcionalidad original)
     backend_instance.run_mqtt_mode()
@@ -384,15 +633,17 @@ def main():
 if __name__ == "__main__":
     # Manejador de señales
     def signal_handler(sig, frame):
-        print("\n\n⚠️ Señal de interrupción recibida")
+        log.warning("\n\n⚠️ Señal de interrupción recibida")
         sys.exit(0)
     
     signal.signal(signal.SIGINT, signal_handler)
     
+    listener = setup_logging()
+    
     try:
         main()
     except Exception as e:
-        print(f"\n❌ Error fatal: {e}")
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
\ No newline at end of file
+        log.exception("\n❌ Error fatal: %s", e)
+        sys.exit(1)
+    finally:
+        listener.stop()
\ No newline at end of file
@@ -5,8 +5,10 @@ Maneja la lectura de DHT22 (temperatura/humedad) y LDR (luz)
 
 import time
 import random
+from collections import namedtuple
 from datetime import datetime
 import config
+from .timeutil import format_iso, now_iso
 
 # Intentar importar librerías de hardware real
 try:
@@ -17,82 +19,119 @@ except ImportError:
     REAL_HARDWARE = False
     print("⚠️ Modo simulación: librerías de hardware no disponibles")
 
+# Tamaño de los buffers de valores simulados (potencia de 2 para usar máscara)
+SIM_BUFFER_SIZE = 4096
+SIM_BUFFER_MASK = SIM_BUFFER_SIZE - 1
+
+
+class DHTReading(namedtuple("DHTReading", "temperature humidity ts_ns status")):
+    """Lectura del DHT22 (tupla sin __dict__; el timestamp ISO se formatea al pedirlo)"""
+    
+    __slots__ = ()
+    
+    @property
+    def timestamp(self):
+        """Timestamp ISO de la lectura"""
+        return format_iso(self.ts_ns / 1e9)
+
 
 class DHT22Sensor:
     """Sensor de temperatura y humedad DHT22"""
     
+    MIN_INTERVAL = 2.0  # El DHT22 no admite más de una lectura cada 2 s
+    
     def __init__(self, pin=None):
         self.pin = pin or config.GPIO_PINS["dht22_data"]
         self.temperature = None
         self.humidity = None
+        self._last = None  # (instante monotónico, lectura) de la última lectura
+        
+        # En hardware real el objeto DHT22 se crea en la primera lectura y se reutiliza
+        self.sensor = None
+        self._sensor_failed = False
         
         if REAL_HARDWARE:
+            print(f"📊 DHT22 en pin {self.pin} (se inicializa en la primera lectura)")
+        else:
+            print("📊 DHT22 en modo simulación")
+            
+            # Lecturas simuladas pregeneradas: read() solo indexa el buffer
+            uniform = random.uniform
+            self._temp_buf = tuple(round(25.0 + uniform(-3, 8), 1)
+                                   for _ in range(SIM_BUFFER_SIZE))
+            self._hum_buf = tuple(round(55.0 + uniform(-15, 20), 1)
+                                  for _ in range(SIM_BUFFER_SIZE))
+            self._sim_idx = 0
+    
+    def _open_sensor(self):
+        """Crea el objeto adafruit_dht una sola vez (None si falla)"""
+        if self.sensor is None and not self._sensor_failed:
             try:
-                # Configurar sensor real
                 self.sensor = adafruit_dht.DHT22(getattr(board, f"D{self.pin}"))
                 print(f"✅ DHT22 inicializado en pin {self.pin}")
             except Exception as e:
                 print(f"❌ Error inicializando DHT22: {e}")
-                self.sensor = None
-        else:
-            self.sensor = None
-            print("📊 DHT22 en modo simulación")
+                self._sensor_failed = True
+        return self.sensor
     
     def read(self):
-        """Lee temperatura y humedad del sensor"""
+        """Lee temperatura y humedad del sensor y retorna un DHTReading"""
         try:
-            if REAL_HARDWARE and self.sensor:
+            if REAL_HARDWARE:
                 # Leer sensor real
-                self.temperature = self.sensor.temperature
-                self.humidity = self.sensor.humidity
+                sensor = self._open_sensor()
+                if sensor is None:
+                    return None
+                self.temperature = sensor.temperature
+                self.humidity = sensor.humidity
             else:
-                # Simular lecturas realistas
-                # Temperatura base con variación aleatoria
-                base_temp = 25.0
-                self.temperature = round(base_temp + random.uniform(-3, 8), 1)
-                
-                # Humedad base con variación
-                base_humidity = 55.0
-                self.humidity = round(base_humidity + random.uniform(-15, 20), 1)
+                # Simular lecturas realistas (25°C -3/+8, 55% -15/+20)
+                i = self._sim_idx & SIM_BUFFER_MASK
+                self._sim_idx += 1
+                self.temperature = self._temp_buf[i]
+                self.humidity = self._hum_buf[i]
             
-            return {
-                "temperature": self.temperature,
-                "humidity": self.humidity,
-                "timestamp": datetime.now().isoformat(),
-                "status": "ok"
-            }
+            data = DHTReading(self.temperature, self.humidity, time.time_ns(), "ok")
+            self._last = (time.monotonic(), data)
+            return data
         
         except RuntimeError as e:
             # Error común de lectura DHT22 (sensor ocupado)
             print(f"⚠️ Error leyendo DHT22: {e}")
-            return {
-                "temperature": self.temperature,  # Retornar última lectura
-                "humidity": self.humidity,
-                "timestamp": datetime.now().isoformat(),
-                "status": "error_retry"
-            }
+            # Retornar última lectura
+            return DHTReading(self.temperature, self.humidity, time.time_ns(), "error_retry")
         except Exception as e:
             print(f"❌ Error crítico DHT22: {e}")
             return None
     
+    def _recent(self):
+        """Última lectura si es reciente; si no, lee el sensor"""
+        last = self._last
+        if last and time.monotonic() - last[0] < self.MIN_INTERVAL:
+            return last[1]
+        return self.read()
+    
     def get_temperature(self):
         """Obtiene solo la temperatura"""
-        data = self.read()
-        return data["temperature"] if data else None
+        data = self._recent()
+        return data.temperature if data else None
     
     def get_humidity(self):
         """Obtiene solo la humedad"""
-        data = self.read()
-        return data["humidity"] if data else None
+        data = self._recent()
+        return data.humidity if data else None
 
 
 class LDRSensor:
     """Sensor de luz LDR (Light Dependent Resistor)"""
     
+    MIN_INTERVAL = 0.5  # Segundos durante los que se reutiliza la última lectura
+    
     def __init__(self, pin=None):
         self.pin = pin or config.GPIO_PINS["ldr_analog"]
         self.light_level = None
         self.last_reading = None
+        self._last = None  # (instante monotónico, datos) de la última lectura
         
         if REAL_HARDWARE:
             try:
@@ -103,6 +142,12 @@ class LDRSensor:
                 print(f"❌ Error inicializando LDR: {e}")
         else:
             print("💡 LDR en modo simulación")
+            
+            # Valores ADC simulados pregenerados para día y noche
+            randint = random.randint
+            self._day_buf = tuple(randint(600, 1000) for _ in range(SIM_BUFFER_SIZE))
+            self._night_buf = tuple(randint(50, 300) for _ in range(SIM_BUFFER_SIZE))
+            self._sim_idx = 0
     
     def read_analog(self):
         """Lee valor analógico del LDR (0-1023 o 0-4095 según ADC)"""
@@ -114,17 +159,16 @@ class LDRSensor:
         else:
             # Simular valor ADC (0-1023)
             # Valores bajos = oscuro, valores altos = brillante
-            current_hour = datetime.now().hour
+            current_hour = time.localtime().tm_hour
+            i = self._sim_idx & SIM_BUFFER_MASK
+            self._sim_idx += 1
             
             # Simular ciclo día/noche
             if 6 <= current_hour <= 18:
                 # Día: más luz
-                base_value = random.randint(600, 1000)
-            else:
-                # Noche: poca luz
-                base_value = random.randint(50, 300)
-            
-            return base_value
+                return self._day_buf[i]
+            # Noche: poca luz
+            return self._night_buf[i]
     
     def analog_to_lux(self, analog_value):
         """Convierte valor analógico a aproximación de lux"""
@@ -133,26 +177,35 @@ class LDRSensor:
         lux = (analog_value / 1023.0) * 1000
         return round(lux, 1)
     
-    def read(self):
-        """Lee nivel de luz en lux"""
+    def read(self, ts=None):
+        """Lee nivel de luz en lux (ts: timestamp ISO ya calculado)"""
         try:
             analog = self.read_analog()
             self.light_level = self.analog_to_lux(analog)
-            self.last_reading = datetime.now()
+            self.last_reading = ts = ts or now_iso()
             
-            return {
+            data = {
                 "light_level": self.light_level,
                 "analog_value": analog,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": ts,
                 "status": "ok"
             }
+            self._last = (time.monotonic(), data)
+            return data
         except Exception as e:
             print(f"❌ Error leyendo LDR: {e}")
             return None
     
+    def _recent(self):
+        """Última lectura si es reciente; si no, lee el sensor"""
+        last = self._last
+        if last and time.monotonic() - last[0] < self.MIN_INTERVAL:
+            return last[1]
+        return self.read()
+    
     def get_light_level(self):
         """Obtiene solo el nivel de luz"""
-        data = self.read()
+        data = self._recent()
         return data["light_level"] if data else None
     
     def is_dark(self, threshold=None):
@@ -170,6 +223,20 @@ class SensorManager:
         self.ldr = LDRSensor()
         self.readings_count = 0
         self.last_read_time = None
+        self._last_ts = None  # Timestamp ISO de la última lectura consolidada
+        
+        # Umbrales y mensajes fijos tras el arranque: se copian una sola vez
+        th = config.THRESHOLDS
+        self._t_crit = th["temperature_critical"]
+        self._t_high = th["temperature_high"]
+        self._t_low = th["temperature_low"]
+        self._h_crit = th["humidity_critical"]
+        self._h_high = th["humidity_high"]
+        self._light_thr = th["light_threshold"]
+        self._msg_t_crit = config.MESSAGES["temp_critical"]
+        self._msg_t_high = config.MESSAGES["temp_high"]
+        self._msg_h_high = config.MESSAGES["humidity_high"]
+        
         print("\n" + "="*50)
         print("📡 SENSOR MANAGER INICIALIZADO")
         print("="*50)
@@ -177,21 +244,22 @@ class SensorManager:
     def read_all(self):
         """Lee todos los sensores y retorna datos consolidados"""
         self.readings_count += 1
-        self.last_read_time = datetime.now()
+        self._last_ts = ts = now_iso()  # Un único timestamp por lectura
+        self.last_read_time = datetime.fromisoformat(ts)
         
         # Leer cada sensor
         dht_data = self.dht22.read()
-        ldr_data = self.ldr.read()
+        ldr_data = self.ldr.read(ts)
         
         # Consolidar datos
         readings = {
-            "timestamp": datetime.now().isoformat(),
-            "temperature": dht_data["temperature"] if dht_data else None,
-            "humidity": dht_data["humidity"] if dht_data else None,
+            "timestamp": ts,
+            "temperature": dht_data.temperature if dht_data else None,
+            "humidity": dht_data.humidity if dht_data else None,
             "light_level": ldr_data["light_level"] if ldr_data else None,
             "readings_count": self.readings_count,
             "sensors_status": {
-                "dht22": dht_data["status"] if dht_data else "error",
+                "dht22": dht_data.status if dht_data else "error",
                 "ldr": ldr_data["status"] if ldr_data else "error"
             }
         }
@@ -208,19 +276,19 @@ class SensorManager:
         
         # Verificar temperatura
         if temp:
-            if temp > config.THRESHOLDS["temperature_critical"]:
+            if temp > self._t_crit:
                 alerts.append({
                     "type": "temperature_critical",
                     "value": temp,
-                    "message": config.MESSAGES["temp_critical"]
+                    "message": self._msg_t_crit
                 })
-            elif temp > config.THRESHOLDS["temperature_high"]:
+            elif temp > self._t_high:
                 alerts.append({
                     "type": "temperature_high",
                     "value": temp,
-                    "message": config.MESSAGES["temp_high"]
+                    "message": self._msg_t_high
                 })
-            elif temp < config.THRESHOLDS["temperature_low"]:
+            elif temp < self._t_low:
                 alerts.append({
                     "type": "temperature_low",
                     "value": temp,
@@ -229,21 +297,21 @@ class SensorManager:
         
         # Verificar humedad
         if humidity:
-            if humidity > config.THRESHOLDS["humidity_critical"]:
+            if humidity > self._h_crit:
                 alerts.append({
                     "type": "humidity_critical",
                     "value": humidity,
                     "message": "💧 ALERTA: Humedad crítica"
                 })
-            elif humidity > config.THRESHOLDS["humidity_high"]:
+            elif humidity > self._h_high:
                 alerts.append({
                     "type": "humidity_high",
                     "value": humidity,
-                    "message": config.MESSAGES["humidity_high"]
+                    "message": self._msg_h_high
                 })
         
         # Verificar luz
-        if light is not None and light < config.THRESHOLDS["light_threshold"]:
+        if light is not None and light < self._light_thr:
             alerts.append({
                 "type": "low_light",
                 "value": light,
@@ -0,0 +1,30 @@
+"""
+Timestamps ISO compartidos por backend, sensores y API
+Un único formato (hora local con milisegundos) y una caché de 100 ms
+"""
+
+import time
+
+# Resolución de la caché de now_iso(): como mucho un formateo cada 100 ms
+ISO_CACHE_SECONDS = 0.1
+
+# (texto, instante): una sola asignación, los threads nunca ven un par mezclado
+_cache = ("", 0.0)
+
+
+def format_iso(epoch):
+    """Timestamp ISO local con milisegundos de un instante epoch (segundos)"""
+    return (time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(epoch))
+            + f".{int((epoch % 1) * 1000):03d}")
+
+
+def now_iso():
+    """Timestamp ISO actual, regenerado como máximo cada 100 ms"""
+    global _cache
+    now = time.time()
+    text, cached_at = _cache
+    if now - cached_at < ISO_CACHE_SECONDS:
+        return text
+    text = format_iso(now)
+    _cache = (text, now)
+    return text
@@ -1,18 +1,31 @@
 import paho.mqtt.client as mqtt
 import ssl
+import sys
+import time
+import threading
 
 BROKER = "a696d90a2b6f41fe9008b1f1dcda2db5.s1.eu.hivemq.cloud"
 PORT = 8884  # WebSockets + TLS
 
-client = mqtt.Client(transport="websockets")
+TOPIC = "smarthome/test"
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 1000  # Mensajes a publicar
+QOS = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, transport="websockets")
 
 client.tls_set(cert_reqs=ssl.CERT_NONE)
 client.tls_insecure_set(True)
 
 client.username_pw_set("smarthome", "SmartHome123!")
 
-def on_connect(client, userdata, flags, rc):
+# QoS 1 en pipeline: hasta 100 mensajes sin confirmar en vuelo
+client.max_inflight_messages_set(100)
+
+connected = threading.Event()
+
+def on_connect(client, userdata, flags, rc, properties):
     print("🔥 Conectado! Código:", rc)
+    connected.set()
 
 client.on_connect = on_connect
 
@@ -20,4 +33,24 @@ print("🔄 Conectando por WebSockets TLS...")
 
 client.connect(BROKER, PORT, keepalive=60)
 
-client.loop_forever()
+# Loop de red en su propio thread: el principal solo publica
+client.loop_start()
+
+if not connected.wait(timeout=10):
+    print("❌ Sin conexión tras 10 s")
+    client.loop_stop()
+    sys.exit(1)
+
+payload = b'{"temperature":25.0,"humidity":55.0,"light":500}'
+
+print(f"📤 Publicando {N} mensajes (QoS {QOS}) en {TOPIC}...")
+start = time.perf_counter()
+infos = [client.publish(TOPIC, payload, qos=QOS) for _ in range(N)]
+for info in infos:
+    info.wait_for_publish()
+elapsed = time.perf_counter() - start
+
+print(f"✅ {N} mensajes en {elapsed:.2f} s ({N / elapsed:.0f} msg/s)")
+
+client.disconnect()
+client.loop_stop()
@@ -0,0 +1,66 @@
+"""
+Pruebas de DatabaseManager (buffer de lecturas)
+Ejecutar desde la raíz del repo: python -m unittest discover tests
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import DatabaseManager
+
+
+class ManualFlushDatabase(DatabaseManager):
+    """Sin volcados automáticos durante la prueba: solo drain() explícito"""
+    
+    FLUSH_INTERVAL = 3600
+
+
+class DrainTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db = ManualFlushDatabase(os.path.join(self.tmpdir.name, "test.db"),
+                                      buffer_readings=True)
+        self.db.initialize()
+    
+    def tearDown(self):
+        self.db.close()
+        self.tmpdir.cleanup()
+    
+    def count_readings(self):
+        return self.db.connection.execute("SELECT COUNT(*) FROM sensor_readings").fetchone()[0]
+    
+    def test_drain_writes_pending_readings(self):
+        for i in range(3):
+            self.db.save_sensor_reading(20.0 + i, 50.0, 300.0)
+        
+        self.db.drain()
+        
+        self.assertEqual(len(self.db._pending), 0)
+        self.assertEqual(self.count_readings(), 3)
+    
+    def test_failed_drain_keeps_readings_pending(self):
+        for i in range(3):
+            self.db.save_sensor_reading(20.0 + i, 50.0, 300.0)
+        queued = list(self.db._pending)
+        
+        # Sin la tabla el INSERT falla con sqlite3.OperationalError
+        self.db.connection.execute("DROP TABLE sensor_readings")
+        self.db.drain()
+        
+        self.assertEqual(list(self.db._pending), queued)
+        
+        # El siguiente volcado reintenta el mismo tramo
+        self.db.initialize()
+        self.db.drain()
+        
+        self.assertEqual(len(self.db._pending), 0)
+        self.assertEqual(self.count_readings(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()